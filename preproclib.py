@@ -2,7 +2,7 @@
 
 Library of functions used by sapreproc.py and several other
 scripts written by Edward Buckler. Developed and tested with Python
-2.7.x and OpenCV 2.4.x.
+2.7.x and OpenCV 2.4.x as well as Python 3.x and OpenCV 4.x.
 
 Originally written by Edward Buckler.
 """
@@ -11,10 +11,16 @@ __author__ = 'Edward Buckler V'
 
 import shutil
 import os
+import io
+import sys
 import cv2
 import numpy as np
 from PIL import Image
 import saconfig as sacfg
+import threading
+from multiprocessing.pool import ThreadPool
+from saimage import load_color, decode_color, decode_gray
+import salib
 
 def thresh_binary(image, threshold, maxVal):
     """Turns a image into a binary image (black and white) if given
@@ -40,12 +46,19 @@ def dilate(image, blockSize, iterationsNum):
     imageReturn = cv2.dilate(image, kernel, iterations=iterationsNum)
     return imageReturn
 
+def write_image(path, image):
+    """ Writes an image with cv2.imwrite, raises IOError if it could
+    not be written (e.g. the directory does not exist).
+    """
+    if not cv2.imwrite(path, image):
+        raise IOError("could not write " + path)
+
 def write_file(path, fileName, saveFile, returnPath):
     """ Writes a given file to a certain path with a given file name
     and what is being saved and will return path if returnPath is
     true (1).
     """
-    cv2.imwrite(path + "\\" + fileName, saveFile)
+    write_image(path + "\\" + fileName, saveFile)
     if returnPath == 1:
         return path + "\\" + fileName # Seriously?
 
@@ -53,42 +66,55 @@ def crop(imageFilePath, rmTop, rmRight, rmBottom, rmLeft, saveFilePath):
     """ Crops images if given image, take from left side, take from
     top, take from right side, and take from bottom.
     """
-    with Image.open(imageFilePath) as im:
-        imageWidth, imageHeight = im.size
     image = Image.open(imageFilePath)
+    imageWidth, imageHeight = image.size
     image.crop((rmLeft, rmTop, imageWidth - rmRight, imageHeight - rmBottom)).save(saveFilePath)
 
-def test_pixel_by_row(image, RGBvals, rowToTest, imagePath):
+def test_pixel_by_row(image, RGBvals, rowToTest, imagePath=None):
     """ Tests for pixels of certain color value by row if given image,
     target color, and number of rows to test from top note if image is
-    black and white the rgb value is only one channel.
-    """
-    with Image.open(imagePath) as im:
-        imageWidth, imageHeight = im.size
-    returnArray = []
-    for yVal in range(0, rowToTest):
-        for xVal in range(0, imageWidth - 1):
-            if RGBvals == image[yVal, xVal]:
-                returnArray.append(xVal)
-    return returnArray
-
-def crop_to_plate(originalFilePath, imageBinary, imageBinaryPath, savepath):
+    black and white the rgb value is only one channel. Returns the
+    sorted x positions (the last column is not tested) where any of
+    the rows has the color. imagePath is no longer needed.
+    """
+    imageWidth = image.shape[1]
+    matches = (image[:rowToTest, :imageWidth - 1] == RGBvals)
+    if matches.ndim == 3:
+        matches = matches.all(axis=2)
+    return np.flatnonzero(matches.any(axis=0))
+
+def crop_to_plate(originalFilePath, imageBinary, imageBinaryPath, savepath,
+                  originalImage=None):
     """ Crops down a binary back plate image.
+
+    The side image is cropped to the columns where the top rows of the
+    binary plate image are white and saved to savepath. originalImage
+    is the already decoded side image, it is loaded from
+    originalFilePath if not given. imageBinaryPath is no longer needed.
     """
-    topWhitePixelsArray = test_pixel_by_row(imageBinary, 255, 10, imageBinaryPath)
-    if len(topWhitePixelsArray) != 0:
-        firstWhitePixel = min(topWhitePixelsArray)
-        lastWhitePixel = max(topWhitePixelsArray)
-        with Image.open(imageBinaryPath) as im:
-            imageWidth, imageHeight = im.size
-        crop(originalFilePath, 0, (imageWidth - lastWhitePixel), 0, firstWhitePixel, savepath)
-    else:
-        with Image.open(imageBinaryPath) as im:
-            imageWidth, imageHeight = im.size
-        crop(originalFilePath, 0,0, 0, 0, savepath)        
+    if originalImage is None:
+        originalImage = load_color(originalFilePath)
+    write_image(savepath, plate_columns(originalImage, imageBinary))
+
+def plate_columns(image, imageBinary):
+    """ Returns image cropped to the columns where the top rows of the
+    binary plate image are white, the whole image if there are none.
+    """
+    topWhitePixelsArray = test_pixel_by_row(imageBinary, 255, 10)
+    if len(topWhitePixelsArray) == 0:
+        return image
+    firstWhitePixel = topWhitePixelsArray[0]
+    lastWhitePixel = topWhitePixelsArray[-1]
+    imageWidth = imageBinary.shape[1]
+    # Same as crop(originalFilePath, 0, (imageWidth - lastWhitePixel),
+    #    0, firstWhitePixel, savepath)
+    right = image.shape[1] - (imageWidth - lastWhitePixel)
+    return image[:, firstWhitePixel:right]
 
-def plate_cleanup_file_creation(DirPath):
-    """ Creates the file structure needed for Plate cleanup.
+def plate_cleanup_file_creation(DirPath, max_workers=None):
+    """ Creates the file structure needed for Plate cleanup and moves
+    the images into it. Returns the files that could not be moved (see
+    run_files).
     """
     # Output folder
     if not os.path.exists(DirPath + "\\Output"):
@@ -112,12 +138,16 @@ def plate_cleanup_file_creation(DirPath):
         os.makedirs(DirPath + "\\Plate\\BlackAndWhiteCleaned")
     if not os.path.exists(DirPath + "\\Plate\\CroppedImages"):
         os.makedirs(DirPath + "\\Plate\\CroppedImages")
-    for file in os.listdir(DirPath):
+    def move_image(file, unused):
         imageFilePath = DirPath + "\\" + file
         if file.startswith("Side"):
             shutil.move(imageFilePath, DirPath + "\\SeedImages\\Side")
         if file.startswith("Top"):
             shutil.move(imageFilePath, DirPath + "\\SeedImages\\Top")
+    files = [file for file in os.listdir(DirPath)
+             if file.startswith("Side") or file.startswith("Top")]
+    return run_files(move_image, DirPath + "\\", files, max_workers,
+                     read=False)
 
 def scan_directory_for_file(dirPath, fileType):
     """ Checks directory for file type and returns either 1 (present)
@@ -146,73 +176,359 @@ def makeBorder(image, size):
     returnImage = cv2.copyMakeBorder(image, size, size, size, size, cv2.BORDER_CONSTANT, value=(0, 0, 0))
     return returnImage
 
-def alter_side(dirPath, saveDirPath):
-    """ Removes the need to use IrfanView for the side image.
+def clean_plate_mask(image, threshold=1, border=5):
+    """ Returns the cleaned binary plate image of a Plate CART output.
+
+    Does what thresh_binary, makeBorder, fill_holes, erode(5, 6) and
+    dilate(5, 6) did followed by removing the border again, with less
+    copying: the image is thresholded straight into a zero border
+    buffer that is reused by the thread, holes are filled in place and
+    the six 5x5 erosions and dilations are one opening with the
+    equivalent 25x25 kernel.
+
+    image - grayscale Plate CART output
+    threshold - pixels above this value are plate
+    border - border added around the image while cleaning it up
     """
-    for file in os.listdir(dirPath):
-        if file.endswith(".png") or file.endswith(".jpg"):
-            image = Image.open(dirPath + "\\" + file)
-            image_cropped = image.crop((sacfg.sideCropxpos,sacfg.sideCropypos,sacfg.sideCropwidth,sacfg.sideCropheight))
-            image_rotated = image_cropped.rotate(90,expand=True)
-            image_rotated.save(saveDirPath + file)
+    height, width = image.shape[:2]
+    padded = _border_buffer(height + 2 * border, width + 2 * border)
+    interior = padded[border:border + height, border:border + width]
+    interior[...] = cv2.threshold(image, threshold, 255,
+                                  cv2.THRESH_BINARY)[1]
+    # fill_holes: everything not reached by a flood from the corner.
+    flood = padded.copy()
+    mask = np.zeros((padded.shape[0] + 2, padded.shape[1] + 2), np.uint8)
+    cv2.floodFill(flood, mask, (0, 0), 255)
+    cv2.bitwise_or(padded, cv2.bitwise_not(flood), padded)
+    opened = cv2.morphologyEx(padded, cv2.MORPH_OPEN, _openKernel)
+    return opened[border:border + height, border:border + width]
 
-def alter_top_crop(dirPath, saveDirPath):
-    """ Removes the need to use IrfanView for the Top image.
+# erode(5, 6) then dilate(5, 6) is an opening with a (6*4+1) square.
+_openKernel = np.ones((25, 25), np.uint8)
+_buffers = threading.local()
+
+def _border_buffer(height, width):
+    """ Returns a zeroed uint8 image of the given size, reused by the
+    calling thread.
     """
-    for file in os.listdir(dirPath):
-        if file.endswith(".png") or file.endswith(".jpg"):
-            filePath = dirPath + "\\" + file
-            image = Image.open(filePath)
-            with Image.open(filePath) as im:
-                imageWidth, imageHeight = im.size
-            # Totally hidden dependency here, notice sacfg.
-            image.crop((sacfg.topCropleft,sacfg.topCroptop,
-                        imageWidth,imageHeight)).save(saveDirPath + file)
-
-def alter_color_correction(dirPath, saveDirPath, blueOut, greenOut, redOut):
-    """ Removes need to do custom color correction on images.
+    buffer = getattr(_buffers, 'image', None)
+    if buffer is None or buffer.shape != (height, width):
+        buffer = np.zeros((height, width), np.uint8)
+        _buffers.image = buffer
+    else:
+        buffer[...] = 0
+    return buffer
+
+def image_files(dirPath):
+    """ Returns the names of the .png and .jpg files in a directory.
     """
-    for file in os.listdir(dirPath):
-        if file.endswith(".png") or file.endswith(".jpg"):
-            with Image.open(dirPath + file) as im:
-                imageWidth, imageHeight = im.size
-            cv2im = cv2.imread(dirPath + file)
-            for xVal in range(0, imageWidth):
-                for yVal in range(0, imageHeight):
-                    # red correction
-                    if redOut < 0:
-                        if (cv2im.item(yVal, xVal, 2) + redOut) < 0:
-                            cv2im.itemset((yVal, xVal, 2), 0)
-                        else:
-                            cv2im.itemset((yVal, xVal, 2), (cv2im.item(yVal, xVal, 2) + redOut))
-                    else:
-                        if cv2im.item(yVal, xVal, 2) < 255 - redOut:
-                            cv2im.itemset((yVal, xVal, 2), (cv2im.item(yVal, xVal, 2) + redOut))
-                        elif cv2im.item(yVal, xVal, 2) >= 255 - redOut:
-                            cv2im.itemset((yVal, xVal, 2), 255)
-                    # green correction
-                    if greenOut < 0:
-                        if (cv2im.item(yVal, xVal, 1) + greenOut) < 0:
-                            cv2im.itemset((yVal, xVal, 1), 0)
-                        else:
-                            cv2im.itemset((yVal, xVal, 1), (cv2im.item(yVal, xVal, 1) + greenOut))
-                    else:
-                        if cv2im.item(yVal, xVal, 1) < 255 - greenOut:
-                            cv2im.itemset((yVal, xVal, 1), (cv2im.item(yVal, xVal, 1) + greenOut))
-                        elif cv2im.item(yVal, xVal, 1) >= 255 - greenOut:
-                            cv2im.itemset((yVal, xVal, 1), 255)
-                    # blue correction
-                    if blueOut < 0:
-                        if (cv2im.item(yVal, xVal, 0) + blueOut) < 0:
-                            cv2im.itemset((yVal, xVal, 0), 0)
-                        else:
-                            cv2im.itemset((yVal, xVal, 0), (cv2im.item(yVal, xVal, 0) + blueOut))
-                    else:
-                        if cv2im.item(yVal, xVal, 0) < 255 - blueOut:
-                            cv2im.itemset((yVal, xVal, 0), (cv2im.item(yVal, xVal, 0) + blueOut))
-                        elif cv2im.item(yVal, xVal, 0) >= 255 - blueOut:
-                            cv2im.itemset((yVal, xVal, 0), 255)
-            cv2.imwrite(saveDirPath + file, cv2im)
+    return [file for file in os.listdir(dirPath)
+            if file.endswith(".png") or file.endswith(".jpg")]
+
+def map_files(function, dirPath, files, max_workers=None, prefetch=None,
+              read=True):
+    """ Calls function(file, data) for files of a directory on a thread
+    pool and yields (file, result, error) in the order of files.
+
+    data is the content of dirPath + file. It is read ahead by separate
+    reader threads, at most max_workers + prefetch files are held in
+    memory, so slow (network) storage is read while the workers decode
+    and encode. error is the exception raised for a file (result is
+    then None), one failing file does not stop the others.
+
+    function - called with the file name and its content
+    dirPath - directory with separator, the path of a file is
+              dirPath + file
+    files - file names in the directory
+    max_workers - threads running function (default sacfg.maxWorkers)
+    prefetch - files read ahead (default sacfg.prefetchFiles)
+    read - False calls function(file, None) and reads nothing
+    """
+    if max_workers is None:
+        max_workers = sacfg.maxWorkers
+    if prefetch is None:
+        prefetch = sacfg.prefetchFiles
+    max_workers = max(max_workers, 1)
+    prefetch = max(prefetch, 0)
+    slots = threading.BoundedSemaphore(max_workers + prefetch)
+
+    def read_file(file):
+        slots.acquire() # Released once the file has been processed.
+        if not read:
+            return None, None
+        try:
+            with open(dirPath + file, 'rb') as imageFile:
+                return imageFile.read(), None
+        except (IOError, OSError) as error:
+            return None, error
+
+    def process(job):
+        file, (data, error) = job
+        try:
+            if error is not None:
+                return file, None, error
+            return file, function(file, data), None
+        except Exception as error:
+            return file, None, error
+        finally:
+            slots.release()
+
+    readers = ThreadPool(max(prefetch, 1))
+    workers = ThreadPool(max_workers)
+    try:
+        contents = readers.imap(read_file, files)
+        def jobs():
+            # Pairs each file with its content as the workers need them.
+            for file in files:
+                yield file, next(contents)
+        for result in workers.imap(process, jobs()):
+            yield result
+    finally:
+        workers.close()
+        readers.close()
+        workers.join()
+        readers.join()
+
+def run_files(function, dirPath, files, max_workers=None, prefetch=None,
+              read=True):
+    """ Runs map_files and returns the list of (file, error) of the
+    files that failed, each failure is also printed as it happens.
+    """
+    failures = []
+    for file, result, error in map_files(function, dirPath, files,
+                                         max_workers, prefetch, read):
+        if error is not None:
+            sys.stderr.write("Failed: " + dirPath + file + ": " +
+                             str(error) + "\n")
+            failures.append((file, error))
+    return failures
+
+def alter_side(dirPath, saveDirPath, max_workers=None):
+    """ Removes the need to use IrfanView for the side image. Returns
+    the files that failed (see run_files).
+    """
+    def crop_rotate(file, data):
+        image = Image.open(io.BytesIO(data))
+        image_cropped = image.crop((sacfg.sideCropxpos,sacfg.sideCropypos,sacfg.sideCropwidth,sacfg.sideCropheight))
+        image_rotated = image_cropped.rotate(90,expand=True)
+        image_rotated.save(saveDirPath + file)
+    return run_files(crop_rotate, dirPath + "\\", image_files(dirPath),
+                     max_workers)
+
+def alter_top_crop(dirPath, saveDirPath, max_workers=None):
+    """ Removes the need to use IrfanView for the Top image. Returns
+    the files that failed (see run_files).
+    """
+    def top_crop(file, data):
+        image = Image.open(io.BytesIO(data))
+        imageWidth, imageHeight = image.size
+        # Totally hidden dependency here, notice sacfg.
+        image.crop((sacfg.topCropleft,sacfg.topCroptop,
+                    imageWidth,imageHeight)).save(saveDirPath + file)
+    return run_files(top_crop, dirPath + "\\", image_files(dirPath),
+                     max_workers)
+
+def color_offset_lut(blueOut, greenOut, redOut):
+    """ Returns a 256 entry lookup table (one column per B,G,R channel)
+    that adds the given offsets to each channel, saturating at 0 and
+    255.
+    """
+    values = np.arange(256)
+    lut = np.dstack([np.clip(values + offset, 0, 255)
+                     for offset in (blueOut, greenOut, redOut)])
+    return lut.astype(np.uint8)
+
+def gray_card_matrix(blueIn, greenIn, redIn, target=120):
+    """ Returns a 3x3 B,G,R color matrix that scales the values read
+    from the 'gray 3 square' of the color card to the target gray.
+    """
+    return np.diag([float(target) / blueIn, float(target) / greenIn,
+                    float(target) / redIn])
+
+def color_correct_image(cv2im, blueOut, greenOut, redOut, matrix=None):
+    """ Color corrects a B,G,R image if given the channel offsets and
+    optionally a 3x3 color matrix, which is applied before the offsets.
+    """
+    if matrix is not None:
+        cv2im = cv2.transform(cv2im, np.asarray(matrix, np.float32))
+    if blueOut == 0 and greenOut == 0 and redOut == 0:
+        return cv2im
+    return cv2.LUT(cv2im, color_offset_lut(blueOut, greenOut, redOut))
+
+def alter_color_correction(dirPath, saveDirPath, blueOut, greenOut, redOut,
+                           matrix=None, max_workers=None):
+    """ Removes need to do custom color correction on images. Returns
+    the files that failed (see run_files).
+    """
+    def correct(file, data):
+        cv2im = decode_color(data, dirPath + file)
+        cv2im = color_correct_image(cv2im, blueOut, greenOut, redOut,
+                                    matrix)
+        write_image(saveDirPath + file, cv2im)
+    return run_files(correct, dirPath, image_files(dirPath), max_workers)
+
+def color_correction_stage(blueOut, greenOut, redOut, matrix=None):
+    """ Returns a pipeline stage that color corrects an image (see
+    color_correct_image).
+    """
+    def stage(image):
+        return color_correct_image(image, blueOut, greenOut, redOut, matrix)
+    return stage
+
+def side_crop_stage():
+    """ Returns a pipeline stage that does what alter_side does to an
+    image: crop it to the sideCrop box and rotate it by 90 degrees.
+    """
+    def stage(image):
+        # Same box as the PIL crop in alter_side (left, top, right, bottom)
+        cropped = image[sacfg.sideCropypos:sacfg.sideCropheight,
+                        sacfg.sideCropxpos:sacfg.sideCropwidth]
+        # PIL rotates counterclockwise, so does np.rot90.
+        return np.ascontiguousarray(np.rot90(cropped))
+    return stage
+
+def top_crop_stage():
+    """ Returns a pipeline stage that does what alter_top_crop does to
+    an image: remove topCropleft columns and topCroptop rows.
+    """
+    def stage(image):
+        return image[sacfg.topCroptop:, sacfg.topCropleft:]
+    return stage
+
+def plate_mask(image, model):
+    """ Returns the cleaned binary plate image of a side image, made
+    with a segmentation model (see sasegment.py) instead of the Plate
+    CART algorithm.
+    """
+    return clean_plate_mask(model.mask(image, 'plate'))
+
+def seed_mask(image, model, view="top"):
+    """ Returns the binary seed image of a top or side image made with
+    a segmentation model: the largest blob of the 'seed' class (see
+    salib.findMaxSizeBounds) with its holes filled. With sacfg.multiSeed
+    every blob within the area bounds of the view is kept (see
+    salib.findAllSeedBounds), as samain.analyzeSeeds measures them.
+
+    view - "top" or "side", the area bounds used with multiSeed are
+           topAreaminerror/topAreamaxerror or the side ones
+    """
+    if view == "top":
+        minArea, maxArea = sacfg.topAreaminerror, sacfg.topAreamaxerror
+    elif view == "side":
+        minArea, maxArea = sacfg.sideAreaminerror, sacfg.sideAreamaxerror
+    else:
+        raise ValueError("view must be 'top' or 'side', not " + repr(view))
+    imageBW = model.mask(image, 'seed')
+    seedMask = np.zeros(image.shape[:2], np.uint8)
+    if sacfg.multiSeed:
+        bounds = salib.findAllSeedBounds(imageBW, 127, minArea, maxArea)
+        for seedIndex in bounds['seedIndices']:
+            cv2.drawContours(seedMask, bounds['contourList'], seedIndex,
+                             255, -1)
+        return seedMask
+    bounds = salib.findMaxSizeBounds(imageBW, 127)
+    if len(bounds['contourList']) != 0:
+        cv2.drawContours(seedMask, bounds['contourList'],
+                         bounds['seedIndex'], 255, -1)
+    return seedMask
+
+def plate_crop_stage(model):
+    """ Returns a pipeline stage that crops a side image to the plate
+    found by a segmentation model (see plate_mask and plate_columns).
+    """
+    def stage(image):
+        return plate_columns(image, plate_mask(image, model))
+    return stage
+
+def seed_segment_stage(model, view="top"):
+    """ Returns a pipeline stage that blacks out everything but the
+    seed, as the seed CART output did (see seed_mask). view is "top" or
+    "side".
+    """
+    def stage(image):
+        return cv2.bitwise_and(image, image,
+                               mask=seed_mask(image, model, view))
+    return stage
+
+def run_pipeline(image, stages):
+    """ Runs an image through a list of stages, each stage takes an
+    image and returns the altered image.
+    """
+    for stage in stages:
+        image = stage(image)
+    return image
+
+def preprocess_directory(dirPath, saveDirPath, stages, max_workers=None):
+    """ Loads every image in a directory once, runs it through the
+    stages in memory and only writes the final image. Returns the
+    files that failed (see run_files).
+    """
+    def preprocess(file, data):
+        image = decode_color(data, os.path.join(dirPath, file))
+        write_image(os.path.join(saveDirPath, file),
+                    run_pipeline(image, stages))
+    return run_files(preprocess, os.path.join(dirPath, ""),
+                     image_files(dirPath), max_workers)
+
+def auto_crop_side_plates(DirPath, max_workers=None):
+    """ Auto crops the side images using the Plate CART output and
+    returns the files that failed (see run_files).
+
+    Every Plate CART output in DirPath/Plate is cleaned up into a binary
+    plate image (saved to Plate/BlackAndWhiteCleaned) which is used to
+    crop the matching edited side image (saved to Plate/CroppedImages).
+    The 0 image is skipped as that was simply a starting image and never
+    has a seed in it.
+    """
+    CARTDirPath = DirPath + "\\Plate"
+    originalDirPathSide = DirPath + "\\Edited\\Side"
+    newPathBW = CARTDirPath + "\\BlackAndWhiteCleaned"
+    newPathCropped = CARTDirPath + "\\CroppedImages"
+    files = [file for file in os.listdir(CARTDirPath)
+             if file.endswith(".jpg") and file.find("SideImage000.") == -1]
+
+    def crop_side_plate(file, data):
+        imageFilePath = CARTDirPath + "\\" + file
+        imageBinary = clean_plate_mask(decode_gray(data, imageFilePath))
+        imageBinaryPath = write_file(newPathBW, file, imageBinary, 1)
+        originalFileName = file[:(len(file) - 16)] + ".png"
+        originalFilePath = originalDirPathSide + "\\" + originalFileName
+        crop_to_plate(originalFilePath, imageBinary, imageBinaryPath,
+                      newPathCropped + "\\" + originalFileName,
+                      load_color(originalFilePath))
+        return originalFileName
+
+    # OpenCV releases the GIL, so threads decode, clean up and encode
+    #    several images at once.
+    failures = []
+    for file, originalFileName, error in map_files(crop_side_plate,
+                                                   CARTDirPath + "\\",
+                                                   files, max_workers):
+        if error is not None:
+            sys.stderr.write("Failed: " + CARTDirPath + "\\" + file + ": " +
+                             str(error) + "\n")
+            failures.append((file, error))
+        else:
+            print(originalFileName[:-len(".png")])
+    return failures
+
+def segment_side_plates(DirPath, model, max_workers=None):
+    """ Auto crops the edited side images like auto_crop_side_plates,
+    with the plates found by a segmentation model instead of the Plate
+    CART output. Returns the files that failed (see run_files).
+    """
+    originalDirPathSide = DirPath + "\\Edited\\Side"
+    newPathBW = DirPath + "\\Plate\\BlackAndWhiteCleaned"
+    newPathCropped = DirPath + "\\Plate\\CroppedImages"
+    def crop_side_plate(file, data):
+        image = decode_color(data, originalDirPathSide + "\\" + file)
+        imageBinary = plate_mask(image, model)
+        write_file(newPathBW, file, imageBinary, 0)
+        write_image(newPathCropped + "\\" + file,
+                    plate_columns(image, imageBinary))
+    return run_files(crop_side_plate, originalDirPathSide + "\\",
+                     [file for file in image_files(originalDirPathSide)
+                      if file.find("SideImage000.") == -1], max_workers)
 
 def num_convert(num):
     """ Converts numbers.
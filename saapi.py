@@ -0,0 +1,147 @@
+""" saapi.py - Python interface of the seed analyzer.
+
+Analyzes seed images from other Python code (a notebook, a scheduler or
+a worker pool) without starting samain.py for every directory:
+
+    import saapi
+    result = saapi.analyze_pair('SeedImages/TopImage001.png')
+    result.length, result.volume, result.error
+
+    for result in saapi.analyze_directory('SeedImages', workers=4,
+                                          config={'multiSeed':1}):
+        ...
+
+Results are SeedResult records (named tuples) with the measurements of
+one seed in real world units. config is a dictionary of saconfig values
+used instead of those in saconfig.py. They are set while the images are
+analyzed, so calls with different configs must not run in threads of
+the same process at the same time. Developed and tested with Python
+2.7.x and OpenCV 2.4.x as well as Python 3.x and OpenCV 4.x.
+"""
+
+import os
+import collections
+import contextlib
+import saconfig as sacfg
+import samain
+import sacli
+
+class SeedResult(collections.namedtuple('SeedResult', [
+        'number', 'top_path', 'side_path', 'seed_index', 'length', 'width',
+        'height', 'volume', 'angle', 'color', 'clusters', 'error'])):
+    """ Measurements of one seed.
+
+    number - position of the pair in its directory (as in the 'number'
+             column of the CSV file), None for analyze_pair()
+    top_path, side_path - the images of the pair
+    seed_index - position of the seed from left to right with
+                 multiSeed, otherwise None
+    length, width, height - (units: centimeters)
+    volume - (units: centimeters cubed), 0 if an error was detected
+    angle - angle of the seed in the top image (units: degrees)
+    color - average (R, G, B) of the seed
+    clusters - (count, R, G, B) of the most common colors, most common
+               first (see colorStats in salib.py)
+    error - the detected errors (see samain.py), '' if there are none
+
+    The measurements are None if the pair could not be analyzed at all.
+    """
+    __slots__ = ()
+
+def check_config(config):
+    """ Raises ValueError if a config dictionary has names that are not
+    saconfig values.
+    """
+    unknown = sorted(set(config or {}) - set(sacli.config_names()))
+    if unknown:
+        raise ValueError('Unknown saconfig value: ' + ', '.join(unknown))
+
+@contextlib.contextmanager
+def configured(config):
+    """ Context manager setting the saconfig values of a dictionary for
+    the duration of a block (see check_config()).
+    """
+    config = config or {}
+    check_config(config)
+    previous = dict((name, getattr(sacfg, name)) for name in config)
+    sacli.apply_overrides(config)
+    try:
+        yield
+    finally:
+        sacli.apply_overrides(previous)
+
+def seed_result(row, side_path, number=None):
+    """ Returns the SeedResult of a samain result row.
+    """
+    color = None
+    if 'color value (R)' in row:
+        color = (row['color value (R)'], row['color value (G)'],
+                 row['color value (B)'])
+    clusters = []
+    for n in ('1', '2', '3', '4', '5'):
+        if 'count' + n in row:
+            clusters.append((row['count' + n], row['r' + n], row['g' + n],
+                             row['b' + n]))
+    return SeedResult(number, row['file path'], side_path,
+                      row.get('seed index'), row.get('length (cm)'),
+                      row.get('width (cm)'), row.get('height (cm)'),
+                      row.get('volume (cm3)'), row.get('angle (degrees)'),
+                      color, tuple(clusters), row.get('error', ''))
+
+def analyze_pair(top_path, side_path=None, config=None):
+    """ Returns the SeedResult of the largest seed of a top/side pair.
+    Exceptions raised while analyzing are passed on.
+
+    top_path - path of the top image
+    side_path - path of the side image, found from top_path if None
+    config - dictionary of saconfig values to use, or None
+    """
+    if side_path is None:
+        side_path = samain.findSideFileName(top_path)
+    with configured(config):
+        row = samain.analyzeSeedPair(top_path, side_path)
+    return seed_result(row, side_path)
+
+def analyze_seeds(top_path, side_path=None, config=None):
+    """ Returns a SeedResult for every seed of a top/side pair (see
+    samain.analyzeSeeds()), from left to right.
+
+    Arguments as for analyze_pair().
+    """
+    if side_path is None:
+        side_path = samain.findSideFileName(top_path)
+    with configured(config):
+        rows = samain.analyzeSeeds(top_path, side_path)
+    return [seed_result(row, side_path) for row in rows]
+
+def analyze_directory(path, workers=1, config=None):
+    """ Yields the SeedResults of every TopImage/SideImage pair in a
+    directory, in the order of the CSV file samain.py writes, with one
+    result per seed if multiSeed is set. Results are yielded as soon as
+    their pair is done. An exception raised while analyzing a pair is
+    recorded in the error of its result, the other pairs continue.
+    Raises IOError if path is not a directory.
+
+    path - directory containing the seed images
+    workers - number of worker processes, 1 analyzes in this process
+    config - dictionary of saconfig values to use, or None
+    """
+    if not os.path.isdir(path):
+        raise IOError('Directory not found: ' + path)
+    config = dict(config or {})
+    check_config(config)
+    jobs = [(x, top_path, True, False)
+            for x, top_path in enumerate(samain.findTopFileNames(path))]
+    if workers > 1:
+        # The workers apply config when they start.
+        results = samain.runSeedPairs(jobs, workers, config)
+    else:
+        results = (_process_pair(job, config) for job in jobs)
+    for x, top_path, rows, unused, unused in results:
+        side_path = samain.findSideFileName(top_path)
+        for row in rows:
+            yield seed_result(row, side_path, x)
+
+def _process_pair(job, config):
+    with configured(config):
+        return samain.processSeedPair(job)
@@ -0,0 +1,347 @@
+""" sabench.py - Benchmarks for the seed analyzer scripts.
+
+Generates synthetic top/side image pairs (filled ellipses of known
+size, angle, position and color) on full 1920x1080 frames and on
+frames cropped the way pre-processing crops them, then times every
+stage of samain.py and of the pre-processing. For each stage the time
+per image, the throughput in images/sec and the peak memory of the
+process are reported. The measurements of every pair are also checked
+against the analytic values of the ellipsoid that was drawn.
+
+    python sabench.py [--pairs N] [--repeat N]
+                      [--save-baseline FILE] [--baseline FILE]
+
+--save-baseline stores the results as JSON, --baseline compares a run
+with stored results and fails if a stage got more than --tolerance
+slower. The exit code is 0 when all checks pass and 1 otherwise.
+Developed and tested with Python 2.7.x and OpenCV 2.4.x as well as
+Python 3.x and OpenCV 4.x.
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import numpy as np
+import cv2
+import saconfig as sacfg
+import saimage
+import salib
+import samain
+import saprofile
+import preproclib
+
+# Frame sizes (width, height) of the top and side images.
+FRAMES = {'full':((1920, 1080), (1920, 1080)),
+          'cropped':((1920 - sacfg.topCropleft, 1080 - sacfg.topCroptop),
+                     (sacfg.sideCropheight - sacfg.sideCropypos,
+                      sacfg.sideCropwidth - sacfg.sideCropxpos))}
+
+# Largest relative difference from the analytic values that passes.
+TOLERANCE = {'length':0.03, 'width':0.05, 'height':0.08, 'volume':0.10}
+
+def make_pair(rng, frame):
+    """ Returns (top, side, truth) for one random synthetic seed.
+
+    top and side are B,G,R images of the given frame ('full' or
+    'cropped'). truth holds the drawn semi-axes in pixels: a (top
+    length), b (top width) and c (side height), and the top center.
+    """
+    (topW, topH), (sideW, sideH) = FRAMES[frame]
+    a = rng.randint(60, 150)
+    b = rng.randint(25, 50)
+    c = rng.randint(18, 40)
+    sideA = int(a * rng.uniform(0.6, 0.75))
+    angle = rng.uniform(-40, 40)
+    color = tuple(int(v) for v in rng.randint(90, 250, 3))
+    center = (int(rng.randint(a + 10, topW - a - 10)),
+              int(rng.randint(a + 10, topH - a - 10)))
+    top = np.zeros((topH, topW, 3), np.uint8)
+    cv2.ellipse(top, center, (int(a), int(b)), angle, 0, 360, color, -1)
+    side = np.zeros((sideH, sideW, 3), np.uint8)
+    sideCenter = (int(rng.randint(sideA + 10, sideW - sideA - 10)),
+                  sideH // 2)
+    cv2.ellipse(side, sideCenter, (sideA, int(c)), rng.uniform(-10, 10),
+                0, 360, color, -1)
+    truth = {'a':int(a), 'b':int(b), 'c':int(c), 'center':center}
+    return top, side, truth
+
+def write_pairs(directory, pairs, frame, seed=0):
+    """ Writes TopImage/SideImage pairs to a directory and returns the
+    list of (top_fileName, side_fileName, truth).
+    """
+    rng = np.random.RandomState(seed)
+    written = []
+    for i in range(pairs):
+        top, side, truth = make_pair(rng, frame)
+        top_fileName = os.path.join(directory, 'TopImage%03d.png' % i)
+        side_fileName = os.path.join(directory, 'SideImage%03d.png' % i)
+        cv2.imwrite(top_fileName, top)
+        cv2.imwrite(side_fileName, side)
+        written.append((top_fileName, side_fileName, truth))
+    return written
+
+def expected_values(truth, angle):
+    """ Returns the analytic length, width, height (cm) and volume
+    (cm3) of a synthetic seed.
+
+    The side scale factor depends on where the seed lies, it is
+    calculated from the drawn center and the measured top angle so
+    that only the side measurement itself is checked.
+    """
+    topScale = sacfg.topScaleFactor
+    length = 2 * truth['a']
+    sideScale = salib.calcSideScaleFactor(truth['center'], sacfg.topCropleft,
+                                          sacfg.topCroptop, topScale,
+                                          sacfg.sideScaleFactoreqM,
+                                          sacfg.sideScaleFactoreqB,
+                                          sacfg.sideScaleFactorintersectX,
+                                          sacfg.topCameraDistin,
+                                          sacfg.topCameraDistangle,
+                                          angle, length)
+    # The volume is integrated in top pixels, the side seed is resized
+    #    to the top length first, so its length does not matter.
+    volume = (4.0 / 3.0 * math.pi * truth['a'] * truth['b'] * truth['c'] *
+              topScale * topScale * sideScale)
+    return {'length':length * topScale, 'width':2 * truth['b'] * topScale,
+            'height':2 * truth['c'] * sideScale, 'volume':volume}
+
+def check_accuracy(written):
+    """ Analyzes the pairs and returns the largest relative error of
+    each measurement and the number of pairs reported with an error.
+    """
+    worst = dict((name, 0.0) for name in TOLERANCE)
+    failed = 0
+    for top_fileName, side_fileName, truth in written:
+        row = samain.analyzeSeedPair(top_fileName, side_fileName)
+        if row['error']:
+            failed += 1
+            continue
+        expected = expected_values(truth, float(row['angle (degrees)']))
+        for name, column in (('length', 'length (cm)'),
+                             ('width', 'width (cm)'),
+                             ('height', 'height (cm)'),
+                             ('volume', 'volume (cm3)')):
+            error = abs(float(row[column]) / expected[name] - 1)
+            worst[name] = max(worst[name], error)
+    return worst, failed
+
+def analysis_stages(written):
+    """ Returns (name, function) for every timed stage of samain.py.
+
+    Each function processes all pairs once. Everything except the
+    stage itself (decoding, the earlier stages) is prepared here.
+    """
+    topThresh = sacfg.topthreshValue
+    sideThresh = sacfg.sidethreshVal
+    prepared = []
+    for top_fileName, side_fileName, truth in written:
+        topColor, topBW = saimage.load_image(top_fileName)
+        sideColor, sideBW = saimage.load_image(side_fileName)
+        topVars = salib.findLengthWidth(topBW, topThresh)
+        sideVars = salib.findLengthWidth(sideBW, sideThresh)
+        topContour = topVars['contours'][topVars['largestIndex']]
+        roi = salib.seedRoi(topContour, topVars['center'], topBW.shape,
+                            sacfg.roiPadding)
+        mask = np.zeros_like(topBW)
+        cv2.drawContours(mask, topVars['contours'], topVars['largestIndex'],
+                         255, -1)
+        prepared.append({'files':(top_fileName, side_fileName),
+                         'top':topBW, 'side':sideBW, 'color':topColor,
+                         'topVars':topVars, 'sideVars':sideVars,
+                         'roi':roi, 'mask':mask,
+                         'points':np.nonzero(cv2.transpose(mask))})
+
+    def decode():
+        for item in prepared:
+            saimage.clear_cache()
+            for fileName in item['files']:
+                saimage.load_image(fileName)
+
+    def find_length_width():
+        for item in prepared:
+            salib.findLengthWidth(item['top'], topThresh)
+            salib.findLengthWidth(item['side'], sideThresh)
+
+    def rotate():
+        for item in prepared:
+            topVars = item['topVars']
+            salib.rotateImage(item['top'], topVars['angle'],
+                              topVars['center'], item['roi'])
+
+    def volume():
+        for item in prepared:
+            salib.findVolume(item['top'], item['side'], item['topVars'],
+                             item['sideVars'], sideThresh,
+                             sacfg.topScaleFactor, 0.003)
+
+    def ellipse_axes():
+        for item in prepared:
+            salib.ellipseAxes(item['points'], item['points'])
+
+    def color_stats():
+        for item in prepared:
+            salib.colorStats(item['color'], item['mask'],
+                             sacfg.colorClusters, sacfg.colorBinSize)
+
+    def analyze_pair():
+        for item in prepared:
+            saimage.clear_cache()
+            samain.analyzeSeedPair(*item['files'])
+
+    return [('decode', decode), ('findLengthWidth', find_length_width),
+            ('rotateImage', rotate), ('findVolume', volume),
+            ('ellipseAxes', ellipse_axes), ('colorStats', color_stats),
+            ('analyzeSeedPair', analyze_pair)]
+
+def preprocessing_stages(written, directory):
+    """ Returns (name, function) for every timed pre-processing stage,
+    run on full frames.
+    """
+    images = [saimage.load_color(top_fileName)
+              for top_fileName, side_fileName, truth in written]
+    colorStage = preproclib.color_correction_stage(10, -5, 3)
+    stages = [colorStage, preproclib.top_crop_stage()]
+    sideStage = preproclib.side_crop_stage()
+    inputDir = os.path.dirname(written[0][0]) + os.sep
+    outputDir = os.path.join(directory, 'corrected') + os.sep
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+
+    def color_correction():
+        for image in images:
+            colorStage(image)
+
+    def crop_stages():
+        for image in images:
+            preproclib.run_pipeline(image, stages)
+            sideStage(image)
+
+    def alter_color_correction():
+        # Reads and writes the top and side images of the directory.
+        preproclib.alter_color_correction(inputDir, outputDir, 10, -5, 3)
+
+    return [('color_correct_image', color_correction),
+            ('crop stages', crop_stages),
+            ('alter_color_correction', alter_color_correction)]
+
+def time_stage(function, images, repeat):
+    """ Returns (seconds per image, images/sec) of the best of repeat
+    runs of a stage function over images images.
+    """
+    best = min(timeit.repeat(function, number=1, repeat=repeat))
+    perImage = best / images
+    return perImage, (1.0 / perImage if perImage > 0 else float('inf'))
+
+def run_benchmarks(pairs, repeat, directory):
+    """ Runs all benchmarks and returns the results as a dictionary.
+    """
+    results = {'stages':{}, 'accuracy':{}, 'errors':{}}
+    for frame in sorted(FRAMES):
+        frameDir = os.path.join(directory, frame)
+        os.makedirs(frameDir)
+        written = write_pairs(frameDir, pairs, frame)
+        worst, failed = check_accuracy(written)
+        results['accuracy'][frame] = worst
+        results['errors'][frame] = failed
+        stages = analysis_stages(written)
+        if frame == 'full':
+            stages += preprocessing_stages(written, directory)
+        for name, function in stages:
+            # alter_color_correction handles top and side images.
+            images = 2 * pairs if name == 'alter_color_correction' else pairs
+            perImage, rate = time_stage(function, images, repeat)
+            results['stages'][frame + ' ' + name] = {
+                'ms_per_image':perImage * 1000.0, 'images_per_sec':rate,
+                'peak_memory_mb':saprofile.peak_memory_mb()}
+    return results
+
+def print_results(results, baseline=None):
+    """ Prints the results as a table, with the speedup over the
+    baseline if one is given.
+    """
+    print('%-36s %10s %10s %10s %9s' % ('stage', 'ms/image', 'images/s',
+                                         'peak MB', 'vs base'))
+    for name in sorted(results['stages']):
+        stage = results['stages'][name]
+        ratio = ''
+        if baseline and name in baseline.get('stages', {}):
+            base = baseline['stages'][name]['images_per_sec']
+            ratio = '%.2fx' % (stage['images_per_sec'] / base)
+        memory = stage['peak_memory_mb']
+        print('%-36s %10.3f %10.1f %10s %9s' % (
+            name, stage['ms_per_image'], stage['images_per_sec'],
+            '-' if memory is None else '%.1f' % memory, ratio))
+    print('')
+    for frame in sorted(results['accuracy']):
+        worst = results['accuracy'][frame]
+        print('%s: largest relative error %s, pairs with errors: %d' % (
+            frame, ', '.join('%s %.4f' % (name, worst[name])
+                             for name in sorted(worst)),
+            results['errors'][frame]))
+
+def check_results(results, baseline=None, tolerance=0.2):
+    """ Returns a list of failed checks (empty if all passed).
+    """
+    failures = []
+    for frame, worst in sorted(results['accuracy'].items()):
+        if results['errors'][frame]:
+            failures.append('%s: %d pairs reported an error' %
+                            (frame, results['errors'][frame]))
+        for name, error in sorted(worst.items()):
+            if error > TOLERANCE[name]:
+                failures.append('%s: %s off by %.1f%%' %
+                                (frame, name, error * 100))
+    if baseline:
+        for name, stage in sorted(results['stages'].items()):
+            base = baseline.get('stages', {}).get(name)
+            if base and stage['images_per_sec'] < \
+                    base['images_per_sec'] * (1 - tolerance):
+                failures.append('%s: %.1f images/s, baseline %.1f' %
+                                (name, stage['images_per_sec'],
+                                 base['images_per_sec']))
+    return failures
+
+def main(argv=None):
+    """ Runs the benchmarks and returns the exit code.
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark the seed analyzer on synthetic images.')
+    parser.add_argument('--pairs', type=int, default=8,
+                        help='synthetic pairs per frame size (default 8)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timing runs per stage, the best is kept '
+                        '(default 3)')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='compare with the results stored in FILE')
+    parser.add_argument('--save-baseline', metavar='FILE',
+                        help='store the results in FILE')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown against the baseline '
+                        '(default 0.2 = 20%%)')
+    args = parser.parse_args(argv)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            baseline = json.load(baselineFile)
+    directory = tempfile.mkdtemp(prefix='sabench')
+    try:
+        results = run_benchmarks(args.pairs, args.repeat, directory)
+    finally:
+        shutil.rmtree(directory)
+        saimage.clear_cache()
+    print_results(results, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baselineFile:
+            json.dump(results, baselineFile, indent=1, sort_keys=True)
+    failures = check_results(results, baseline, args.tolerance)
+    for failure in failures:
+        sys.stderr.write('FAILED ' + failure + '\n')
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+""" sacache.py - Per-image result cache for incremental analysis.
+
+Results of samain.py are stored in a JSON-lines file, one line per
+analyzed top/side pair, keyed on the paths, sizes and modification
+times of both images plus a hash of the saconfig values that change
+the measurements. A line is written (and flushed) as soon as a pair is
+done, so when a run stops part way a re-run skips the pairs that are
+already in the cache and continues where it stopped. Pairs whose
+images or configuration changed are analyzed again. Developed and
+tested with Python 2.7.x and 3.x.
+"""
+
+import hashlib
+import json
+import os
+import saconfig as sacfg
+
+# The saconfig values that change the measurements of a pair. Settings
+#    that only change how a run goes (workers, memory use, debug images,
+#    ...) are left out so changing them does not redo cached pairs.
+measurementValues = [
+    'topScaleFactor', 'topCameraDistin', 'topCameraDistangle',
+    'sideScaleFactoreqM', 'sideScaleFactoreqB', 'sideScaleFactorintersectX',
+    'frameWidth', 'frameHeight', 'sideScaleGridStep',
+    'topCropleft', 'topCroptop', 'sideCropxpos', 'sideCropypos',
+    'sideCropwidth', 'sideCropheight',
+    'topAreamaxerror', 'topAreaminerror', 'topAnglemaxerror',
+    'sideAreamaxerror', 'sideAreaminerror', 'topthreshValue', 'sidethreshVal',
+    'colorClusters', 'colorBinSize', 'roiPadding', 'useConnectedComponents',
+    'multiSeed', 'cropOnLoad']
+
+def config_hash():
+    """ Returns a hash of the saconfig values in measurementValues.
+    """
+    values = [(name, repr(getattr(sacfg, name))) for name in measurementValues]
+    return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+
+def pair_key(top_fileName, side_fileName, configHash):
+    """ Returns the cache key of a top/side pair.
+    """
+    parts = [configHash]
+    for fileName in (top_fileName, side_fileName):
+        if os.path.isfile(fileName):
+            stat = os.stat(fileName)
+            parts.extend([os.path.abspath(fileName), stat.st_size,
+                          stat.st_mtime])
+        else:
+            parts.extend([os.path.abspath(fileName), None, None])
+    return hashlib.sha1(json.dumps(parts).encode('utf-8')).hexdigest()
+
+class ResultCache(object):
+    """ JSON-lines file of analysis results keyed by pair_key().
+
+    path - cache file, created if it does not exist
+    """
+    def __init__(self, path):
+        self.path = path
+        self._rows = {}
+        line = '\n'
+        if os.path.isfile(path):
+            with open(path) as cacheFile:
+                for line in cacheFile:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A run that crashed while writing leaves a
+                        #    partial last line, that pair is redone.
+                        continue
+                    self._rows[entry['key']] = entry['row']
+        self._file = open(path, 'a')
+        if not line.endswith('\n'):
+            self._file.write('\n') # Start after the partial line.
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def get(self, key):
+        """ Returns the cached row of a key or None.
+        """
+        return self._rows.get(key)
+
+    def put(self, key, row):
+        """ Stores a row and writes it to the cache file right away.
+        """
+        self._rows[key] = row
+        self._file.write(json.dumps({'key':key, 'row':row}) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
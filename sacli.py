@@ -0,0 +1,537 @@
+""" sacli.py - Command line interface for the seed analyzer scripts.
+
+Runs every step of the workflow without prompts so that runs can be
+scheduled and batched:
+
+    python sacli.py organize DIR
+    python sacli.py color-correct DIR --red R --green G --blue B
+    python sacli.py crop DIR
+    python sacli.py plate-crop DIR [--model MODEL]
+    python sacli.py segment DIR --model MODEL
+    python sacli.py train MODEL --sample CLASS IMAGE ...
+                                (or --range CLASS B,G,R B,G,R ...)
+    python sacli.py watch DIR [--red R --green G --blue B] [--model MODEL]
+    python sacli.py analyze DIR [--workers N] [--incremental]
+                                [--timings] [--trace FILE] [--profile FILE]
+                                [--columnar FILE.npz|FILE.parquet]
+
+sapreproc.py and samain.py are thin wrappers around these subcommands.
+Every subcommand accepts --config FILE (a file of 'name = value' lines
+in the same format as saconfig.py) and --set name=value to override
+any saconfig value for this run, --set wins over --config.
+
+The exit code tells a job scheduler how the run went:
+    0 (EXIT_OK) - finished
+    1 (EXIT_FAILURE) - an unexpected error stopped the run
+    2 (EXIT_USAGE) - bad command line or configuration
+    3 (EXIT_MISSING_INPUT) - input directory or files not found, e.g.
+        the Plate CART output has not been placed in DIR\\Plate yet
+    4 (EXIT_PARTIAL) - finished, but some images failed, they are
+        listed on stderr
+Developed and tested with Python 2.7.x and OpenCV 2.4.x as well as
+Python 3.x and OpenCV 4.x.
+"""
+
+import argparse
+import cProfile
+import os
+import pstats
+import sys
+import traceback
+import types
+import numpy as np
+import saconfig as sacfg
+import preproclib
+import sasink
+
+EXIT_OK = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_MISSING_INPUT = 3
+EXIT_PARTIAL = 4
+
+def config_names():
+    """ Returns the names of all values defined in saconfig.
+    """
+    return sorted(name for name, value in vars(sacfg).items()
+                  if not name.startswith('_')
+                  and not isinstance(value, types.ModuleType))
+
+def parse_config_value(name, text):
+    """ Converts the text of a config value to a number where possible.
+    """
+    if name not in config_names():
+        raise ValueError('Unknown saconfig value: ' + name)
+    text = text.strip()
+    try:
+        return preproclib.num_convert(text)
+    except ValueError:
+        return text.strip('\'"')
+
+def load_config_file(path):
+    """ Returns the saconfig overrides from a config file.
+
+    The file uses the syntax of saconfig.py: one 'name = value' per
+    line, anything after a # is a comment.
+    """
+    overrides = {}
+    with open(path) as configFile:
+        for lineNumber, line in enumerate(configFile, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            if '=' not in line:
+                raise ValueError('%s:%d: expected name = value' %
+                                 (path, lineNumber))
+            name, text = line.split('=', 1)
+            overrides[name.strip()] = parse_config_value(name.strip(), text)
+    return overrides
+
+def apply_overrides(overrides):
+    """ Sets the given saconfig values. Also used as the initializer of
+    worker processes so they see the same configuration.
+    """
+    for name, value in overrides.items():
+        setattr(sacfg, name, value)
+
+def collect_overrides(args):
+    """ Returns the saconfig overrides of the --config and --set options.
+    """
+    overrides = {}
+    if args.config:
+        overrides.update(load_config_file(args.config))
+    for setting in args.set:
+        if '=' not in setting:
+            raise ValueError('--set expects name=value, got: ' + setting)
+        name, text = setting.split('=', 1)
+        overrides[name.strip()] = parse_config_value(name.strip(), text)
+    return overrides
+
+def missing_directory(path):
+    """ Prints an error and returns True if path is not a directory.
+    """
+    if os.path.isdir(path):
+        return False
+    sys.stderr.write('Directory not found: ' + path + '\n')
+    return True
+
+def files_exit_code(failures):
+    """ Returns the exit code of a step given the files that failed.
+    """
+    if failures:
+        sys.stderr.write('%d images failed\n' % len(failures))
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+def cmd_organize(args):
+    """ Creates the folder structure and sorts the images into it.
+    """
+    if missing_directory(args.directory):
+        return EXIT_MISSING_INPUT
+    return files_exit_code(
+        preproclib.plate_cleanup_file_creation(args.directory))
+
+def preprocess_stages(args, crop=True, model=None):
+    """ Returns the (top, side) pre-processing stages of the color
+    correction options (if --red is given), the crops and, if a
+    segmentation model is given, the plate crop of the side images and
+    the seed segmentation of both (as plate-crop and segment do).
+    """
+    topStages = []
+    sideStages = []
+    if args.red is not None:
+        redOut = args.target - args.red
+        greenOut = args.target - args.green
+        blueOut = args.target - args.blue
+        colorMatrix = None
+        if args.matrix:
+            colorMatrix = preproclib.gray_card_matrix(args.blue, args.green,
+                                                      args.red, args.target)
+            redOut = greenOut = blueOut = 0
+        print("change in red, green, blue will be: %s, %s, %s" %
+              (redOut, greenOut, blueOut))
+        topStages.append(preproclib.color_correction_stage(
+            blueOut, greenOut, redOut, colorMatrix))
+        # The side images have always been corrected with red and blue
+        #    swapped, kept so that results stay comparable.
+        sideStages.append(preproclib.color_correction_stage(
+            redOut, greenOut, blueOut, colorMatrix))
+    if crop:
+        topStages.append(preproclib.top_crop_stage())
+        sideStages.append(preproclib.side_crop_stage())
+    if model is not None:
+        sideStages.append(preproclib.plate_crop_stage(model))
+        topStages.append(preproclib.seed_segment_stage(model, 'top'))
+        sideStages.append(preproclib.seed_segment_stage(model, 'side'))
+    return topStages, sideStages
+
+def cmd_color_correct(args):
+    """ Color corrects (and unless --no-crop also crops) the top and
+    side images using the values read from the 'gray 3 square'.
+    """
+    DirPath = args.directory
+    if missing_directory(DirPath + "\\SeedImages"):
+        return EXIT_MISSING_INPUT
+    topStages, sideStages = preprocess_stages(args, not args.no_crop)
+    failures = preproclib.preprocess_directory(
+        DirPath + "\\SeedImages\\Top\\", DirPath + "\\Edited\\Top\\", topStages)
+    failures += preproclib.preprocess_directory(
+        DirPath + "\\SeedImages\\Side\\", DirPath + "\\Edited\\Side\\",
+        sideStages)
+    return files_exit_code(failures)
+
+def cmd_crop(args):
+    """ Crops the top and side images without color correction.
+    """
+    DirPath = args.directory
+    if missing_directory(DirPath + "\\SeedImages"):
+        return EXIT_MISSING_INPUT
+    failures = preproclib.preprocess_directory(
+        DirPath + "\\SeedImages\\Side\\", DirPath + "\\Edited\\Side\\",
+        [preproclib.side_crop_stage()])
+    failures += preproclib.preprocess_directory(
+        DirPath + "\\SeedImages\\Top\\", DirPath + "\\Edited\\Top\\",
+        [preproclib.top_crop_stage()])
+    return files_exit_code(failures)
+
+def load_model(path, *classNames):
+    """ Returns (model, EXIT_OK) for the segmentation model in path, or
+    (None, exit code) if it is missing or lacks one of classNames.
+    """
+    import sasegment
+    if not os.path.isfile(path):
+        sys.stderr.write('Model not found: ' + path + '\n')
+        return None, EXIT_MISSING_INPUT
+    try:
+        model = sasegment.load_model(path)
+    except (IOError, ValueError) as error:
+        sys.stderr.write(str(error) + '\n')
+        return None, EXIT_USAGE
+    for className in classNames:
+        if className not in model.names:
+            sys.stderr.write('The model has no ' + className + ' class\n')
+            return None, EXIT_USAGE
+    return model, EXIT_OK
+
+def cmd_plate_crop(args):
+    """ Auto crops the side images using the Plate CART output, or the
+    plates found by a segmentation model with --model.
+    """
+    DirPath = args.directory
+    if args.model:
+        model, exitCode = load_model(args.model, 'plate')
+        if model is None:
+            return exitCode
+        if missing_directory(DirPath + "\\Edited\\Side"):
+            return EXIT_MISSING_INPUT
+        for path in (DirPath + "\\Plate\\BlackAndWhiteCleaned",
+                     DirPath + "\\Plate\\CroppedImages"):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        failures = preproclib.segment_side_plates(DirPath, model)
+        print("Now run the segment step (or the CART algorithm) on the "
+              "images in Plate\\CroppedImages and Edited\\Top")
+        return files_exit_code(failures)
+    CARTDirPath = DirPath + "\\Plate"
+    if (missing_directory(CARTDirPath) or
+            not preproclib.scan_directory_for_file(CARTDirPath, ".jpg")):
+        sys.stderr.write("No Plate CART output found, run the plate CART "
+                         "algorithm on the images in Edited\\Side and place "
+                         "the output in the Plate folder (or use --model)\n")
+        return EXIT_MISSING_INPUT
+    failures = preproclib.auto_crop_side_plates(DirPath)
+    print("Now run the CART algorithm on the side images in Plate\\CroppedImages")
+    print("Also run the CART algorithm on the top images in Edited\\Top")
+    print("Save both to SeedImages\\Output")
+    return files_exit_code(failures)
+
+def cmd_segment(args):
+    """ Blacks out everything but the seed in the edited top images and
+    the plate cropped side images and saves them to DIR\\Output, as the
+    seed CART step did.
+    """
+    DirPath = args.directory
+    model, exitCode = load_model(args.model, 'seed')
+    if model is None:
+        return exitCode
+    if (missing_directory(DirPath + "\\Edited\\Top") or
+            missing_directory(DirPath + "\\Plate\\CroppedImages")):
+        return EXIT_MISSING_INPUT
+    if not os.path.isdir(DirPath + "\\Output"):
+        os.makedirs(DirPath + "\\Output")
+    failures = preproclib.preprocess_directory(
+        DirPath + "\\Edited\\Top\\", DirPath + "\\Output\\",
+        [preproclib.seed_segment_stage(model, 'top')])
+    failures += preproclib.preprocess_directory(
+        DirPath + "\\Plate\\CroppedImages\\", DirPath + "\\Output\\",
+        [preproclib.seed_segment_stage(model, 'side')])
+    print("Now analyze the images in Output")
+    return files_exit_code(failures)
+
+def parse_color(text):
+    """ Returns the B,G,R triple of a 'b,g,r' option value.
+    """
+    values = [int(value) for value in text.split(',')]
+    if len(values) != 3 or not all(0 <= value <= 255 for value in values):
+        raise ValueError('Expected B,G,R values from 0 to 255, got: ' + text)
+    return values
+
+def cmd_train(args):
+    """ Builds a segmentation model from labeled sample images (every
+    pixel of a sample belongs to its class) or from B,G,R ranges, and
+    saves it (see sasegment.py).
+    """
+    import sasegment
+    import saimage
+    if bool(args.sample) == bool(args.range):
+        sys.stderr.write('Give either --sample or --range\n')
+        return EXIT_USAGE
+    if args.range:
+        try:
+            model = sasegment.ChannelThresholds(dict(
+                (name, (parse_color(lower), parse_color(upper)))
+                for name, lower, upper in args.range))
+        except ValueError as error:
+            sys.stderr.write(str(error) + '\n')
+            return EXIT_USAGE
+    else:
+        samples = {}
+        for name, path in args.sample:
+            if not os.path.isfile(path):
+                sys.stderr.write('Sample not found: ' + path + '\n')
+                return EXIT_MISSING_INPUT
+            try:
+                image = saimage.load_color(path)
+            except IOError as error:
+                sys.stderr.write(str(error) + '\n')
+                return EXIT_MISSING_INPUT
+            samples.setdefault(name, []).append(
+                sasegment.sample_pixels(image))
+        try:
+            model = sasegment.PixelClassifier.fit(
+                dict((name, np.concatenate(pixels))
+                     for name, pixels in samples.items()), args.bits)
+        except (ValueError, np.linalg.LinAlgError) as error:
+            sys.stderr.write(str(error) + '\n')
+            return EXIT_USAGE
+    model.save(args.model)
+    print('Saved a model of ' + ', '.join(model.names) + ' to ' + args.model)
+    return EXIT_OK
+
+def cmd_analyze(args):
+    """ Analyzes the seed images of a directory (see samain.py).
+    """
+    import samain
+    if missing_directory(args.directory):
+        return EXIT_MISSING_INPUT
+    cachePath = args.cache
+    if args.incremental and cachePath is None:
+        cachePath = args.directory + '_cache.jsonl'
+    if args.columnar:
+        try:
+            sasink.columnar_format(args.columnar)
+        except (ValueError, ImportError) as error:
+            sys.stderr.write(str(error) + '\n')
+            return EXIT_USAGE
+    workers = args.workers
+    if args.profile and workers > 1:
+        # cProfile only sees the process it runs in.
+        sys.stderr.write('--profile runs with one worker\n')
+        workers = 1
+    runArgs = (args.directory, workers, args.overrides, cachePath,
+               args.timings, args.trace, args.columnar)
+    if args.profile:
+        profiler = cProfile.Profile()
+        analyzed, failures = profiler.runcall(samain.analyzeDirectory,
+                                              *runArgs)
+        profiler.dump_stats(args.profile)
+        print('Profile saved in ' + args.profile + ', slowest calls:')
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+    else:
+        analyzed, failures = samain.analyzeDirectory(*runArgs)
+    if analyzed == 0:
+        sys.stderr.write('No TopImage files found in ' + args.directory + '\n')
+        return EXIT_MISSING_INPUT
+    return files_exit_code(failures)
+
+def cmd_watch(args):
+    """ Analyzes new pairs in a capture directory as they are written
+    (see sawatch.py).
+    """
+    import sawatch
+    if missing_directory(args.directory):
+        return EXIT_MISSING_INPUT
+    colors = [args.red, args.green, args.blue]
+    if None in colors and colors != [None, None, None]:
+        sys.stderr.write('--red, --green and --blue go together\n')
+        return EXIT_USAGE
+    model = None
+    if args.model:
+        model, exitCode = load_model(args.model, 'plate', 'seed')
+        if model is None:
+            return exitCode
+    topStages, sideStages = preprocess_stages(args, not args.no_crop, model)
+    watcher = sawatch.PairWatcher(args.directory, topStages, sideStages,
+                                  args.interval)
+    print('Watching ' + args.directory + ', results go to ' +
+          watcher.csvPath + ' (Ctrl-C stops)')
+    try:
+        watcher.run(args.timeout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return EXIT_OK
+
+def build_parser():
+    """ Returns the argparse parser with all subcommands.
+    """
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--config', metavar='FILE',
+                        help='file of saconfig overrides (name = value)')
+    common.add_argument('--set', metavar='NAME=VALUE', action='append',
+                        default=[], help='override one saconfig value, '
+                        'may be repeated')
+    parser = argparse.ArgumentParser(
+        description='Seed analyzer pre-processing and analysis.')
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    organize = subparsers.add_parser('organize', parents=[common],
+        help='create the folder structure and sort the images into it')
+    organize.add_argument('directory', help='folder containing all images')
+    organize.set_defaults(handler=cmd_organize)
+
+    colorCorrect = subparsers.add_parser('color-correct', parents=[common],
+        help='color correct and crop the top and side images')
+    colorCorrect.add_argument('directory', help='folder containing all images')
+    colorCorrect.add_argument('--red', type=float, required=True,
+                              help="red value of the 'gray 3 square'")
+    colorCorrect.add_argument('--green', type=float, required=True,
+                              help="green value of the 'gray 3 square'")
+    colorCorrect.add_argument('--blue', type=float, required=True,
+                              help="blue value of the 'gray 3 square'")
+    colorCorrect.add_argument('--target', type=float, default=120,
+                              help='gray value of the square (default 120)')
+    colorCorrect.add_argument('--matrix', action='store_true',
+                              help='scale the channels with a color matrix '
+                              'instead of offsetting them')
+    colorCorrect.add_argument('--no-crop', action='store_true',
+                              help='only color correct, do not crop')
+    colorCorrect.set_defaults(handler=cmd_color_correct)
+
+    crop = subparsers.add_parser('crop', parents=[common],
+        help='crop the top and side images without color correction')
+    crop.add_argument('directory', help='folder containing all images')
+    crop.set_defaults(handler=cmd_crop)
+
+    plateCrop = subparsers.add_parser('plate-crop', parents=[common],
+        help='auto crop the side images using the Plate CART output')
+    plateCrop.add_argument('directory', help='folder containing all images')
+    plateCrop.add_argument('--model', metavar='MODEL',
+                           help='find the plates with this segmentation '
+                           'model instead of the Plate CART output')
+    plateCrop.set_defaults(handler=cmd_plate_crop)
+
+    segment = subparsers.add_parser('segment', parents=[common],
+        help='black out everything but the seeds, replaces the seed CART')
+    segment.add_argument('directory', help='folder containing all images')
+    segment.add_argument('--model', metavar='MODEL', required=True,
+                         help='segmentation model with a seed class')
+    segment.set_defaults(handler=cmd_segment)
+
+    train = subparsers.add_parser('train', parents=[common],
+        help='build a segmentation model for plate-crop and segment')
+    train.add_argument('model', help='model file to write (.npz)')
+    train.add_argument('--sample', nargs=2, action='append', default=[],
+                       metavar=('CLASS', 'IMAGE'),
+                       help='image whose pixels all belong to CLASS (seed, '
+                       'plate, background ...), may be repeated')
+    train.add_argument('--range', nargs=3, action='append', default=[],
+                       metavar=('CLASS', 'LOWER', 'UPPER'),
+                       help='pixels of CLASS have B,G,R values from LOWER to '
+                       'UPPER (e.g. 0,0,60 255,255,255), may be repeated')
+    train.add_argument('--bits', type=int, default=5, choices=range(1, 9),
+                       help='bits per channel of the classifier lookup table '
+                       '(default 5)')
+    train.set_defaults(handler=cmd_train)
+
+    analyze = subparsers.add_parser('analyze', parents=[common],
+        help='analyze the seed images and write <directory>_processed.csv')
+    analyze.add_argument('directory',
+                         help='directory name (ex. test12801/SeedImages)')
+    analyze.add_argument('--workers', type=int, default=1,
+                         help='number of worker processes (default 1)')
+    analyze.add_argument('--incremental', action='store_true',
+                         help='skip pairs already in the result cache and '
+                         'resume crashed runs')
+    analyze.add_argument('--cache', metavar='FILE',
+                         help='result cache for --incremental (default '
+                         '<directory>_cache.jsonl)')
+    analyze.add_argument('--columnar', metavar='FILE',
+                         help='also write the results with typed columns '
+                         'to FILE (.npz, or .parquet with pyarrow)')
+    analyze.add_argument('--timings', action='store_true',
+                         help='add the time spent in each stage to the CSV '
+                         'and print a summary')
+    analyze.add_argument('--trace', metavar='FILE',
+                         help='write the stage times of each pair to FILE '
+                         '(JSON lines)')
+    analyze.add_argument('--profile', metavar='FILE',
+                         help='run under cProfile and save the stats to FILE')
+    analyze.set_defaults(handler=cmd_analyze)
+
+    watch = subparsers.add_parser('watch', parents=[common],
+        help='analyze new pairs in a capture directory as they arrive')
+    watch.add_argument('directory', help='capture directory')
+    watch.add_argument('--red', type=float,
+                       help="red value of the 'gray 3 square', color "
+                       "correct with --green and --blue")
+    watch.add_argument('--green', type=float,
+                       help="green value of the 'gray 3 square'")
+    watch.add_argument('--blue', type=float,
+                       help="blue value of the 'gray 3 square'")
+    watch.add_argument('--target', type=float, default=120,
+                       help='gray value of the square (default 120)')
+    watch.add_argument('--matrix', action='store_true',
+                       help='scale the channels with a color matrix '
+                       'instead of offsetting them')
+    watch.add_argument('--no-crop', action='store_true',
+                       help='the images are already cropped')
+    watch.add_argument('--model', metavar='MODEL',
+                       help='segmentation model with plate and seed classes, '
+                       'crops the side images to the plate and blacks out '
+                       'everything but the seeds')
+    watch.add_argument('--interval', type=float, default=1.0,
+                       help='seconds between polls, and seconds an image '
+                       'must be unchanged (default 1)')
+    watch.add_argument('--timeout', type=float, default=0,
+                       help='stop when no pair arrived for this many '
+                       'seconds (default 0, run until Ctrl-C)')
+    watch.set_defaults(handler=cmd_watch)
+    return parser
+
+def main(argv=None):
+    """ Runs the command line interface and returns the exit code.
+    """
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as error:
+        return error.code
+    try:
+        args.overrides = collect_overrides(args)
+    except (IOError, OSError, ValueError) as error:
+        sys.stderr.write(str(error) + '\n')
+        return EXIT_USAGE
+    apply_overrides(args.overrides)
+    try:
+        return args.handler(args)
+    except KeyboardInterrupt:
+        return EXIT_FAILURE
+    except Exception:
+        traceback.print_exc()
+        return EXIT_FAILURE
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+""" sacompat.py - Python and OpenCV version differences.
+
+The seed analyzer scripts run on Python 2.7 with OpenCV 2.4 as well as
+on Python 3 with current OpenCV (3.x and 4.x) builds. The few calls
+that differ between these versions go through this module:
+
+    box_points(rect) - corners of a cv2.minAreaRect() result
+        (cv2.cv.BoxPoints in OpenCV 2.4, cv2.boxPoints later)
+    find_contours(image, mode, method, offset) - (contours, hierarchy)
+        (OpenCV 3.x also returns the image)
+    open_csv(path, mode) - file object for the csv module (binary on
+        Python 2, text without newline translation on Python 3)
+    queue - the Queue module (queue on Python 3)
+"""
+
+import sys
+import numpy as np
+import cv2
+
+PY2 = sys.version_info[0] == 2
+
+if PY2:
+    import Queue as queue
+else:
+    import queue
+
+def box_points(rect):
+    """ Returns the four corners of a rotated rectangle (as returned by
+    cv2.minAreaRect()) as a (4,2) float32 array.
+    """
+    if hasattr(cv2, 'boxPoints'):
+        return cv2.boxPoints(rect)
+    return np.array(cv2.cv.BoxPoints(rect), np.float32)
+
+def find_contours(image, mode, method, offset=(0, 0)):
+    """ Returns (contours, hierarchy) of cv2.findContours() for every
+    OpenCV version. image may be modified by OpenCV before 3.2.
+    """
+    result = cv2.findContours(image, mode, method, offset=offset)
+    return result[-2], result[-1]
+
+def open_csv(path, mode='r'):
+    """ Returns a file opened for the csv module, mode is 'r', 'w' or
+    'a'.
+    """
+    if PY2:
+        return open(path, mode + 'b')
+    return open(path, mode, newline='')
@@ -31,11 +31,24 @@ Specifics are explained below and in the documentation on Google Drive:
                                	directly from the center of the
                                	side camera first intersects the
                                	top image. See documentation.
-    debugmode - 1 for debug mode (shows images at each step), 0 for
-								normal operation. Slows process.
+    debugmode - 1 for debug mode (saves an image of the threshold
+								masks, contours and measurements of
+								each pair, see debugFraction and
+								debugDir), 0 for normal operation.
+								Slows process.
 
 Advanced User Options:
 
+  frameWidth - Width of the top images as the camera takes them,
+                before any cropping. (units: pixels)
+  frameHeight - Height of the top images before any cropping, used to
+                find the distance of a seed from the side camera.
+                (units: pixels)
+  sideScaleGridStep - The side scale factor is looked up in a table
+                computed once per run with one entry every this many
+                pixels of the top image. 1 gives exact values (the
+                table then takes about 10 MB), larger steps use less
+                memory and interpolate. (units: pixels)
 	topCropleft - When pre-processing the top image, this sets the
 								number of columns to be cropped from
 								the left side. It is referred to again
@@ -60,8 +73,51 @@ Advanced User Options:
   sideCropheight - Used when pre-processing the side image, this sets
                 the height (y axis) of the crop. Cropping the side 
                 image speeds up processing.
+  colorClusters - Number of most common seed colors written to the
+                count1,r1,g1,b1 ... count5,r5,g5,b5 columns.
+  colorBinSize - Colors are grouped into bins of this many values per
+                channel before counting, r/g/b is the center of the
+                bin. 1 counts exact colors.
+  roiPadding - After the seed has been found in a full image, later
+                searches (after rotating or resizing) only look at a
+                square around the seed padded by this many pixels.
+  useConnectedComponents - 1 picks the largest blob by its pixel count
+                using connected components (needs OpenCV 3 or newer)
+                and only traces its outline, 0 compares the areas of
+                all outer contours.
+  multiSeed - 1 measures every seed in a top/side pair instead of only
+                the largest object: all objects within the top/side
+                area bounds (topAreaminerror ... sideAreamaxerror) are
+                seeds, top and side seeds are paired by their order
+                along the x-axis and each seed gets its own row with
+                a 'seed index' (0 = leftmost). 0 for one seed per pair.
+  imageCacheSize - Number of decoded images kept in memory so that an
+                image used twice is only decoded once. 0 disables the
+                cache.
+  cropOnLoad - 1 when samain.py analyzes images that were not cropped
+                by the pre-processing (crop step skipped): each image is
+                cropped to topCrop*/sideCrop* right after it is decoded,
+                exactly as the crop step would, and only the crop is
+                kept in memory. 0 for pre-processed images.
+  lowMemory - 1 lowers the memory samain.py needs per worker: no
+                decoded images are cached (see imageCacheSize) and only
+                the grayscale side image is kept. Use analyze --timings
+                to see the peak memory of each pair.
+  maxWorkers - Number of threads the pre-processing steps use to work
+                on several images at once.
+  prefetchFiles - Number of image files the pre-processing steps read
+                ahead while the threads are busy, helps on network
+                storage.
+  resultFlushRows - The result files are written to disk every this
+                many rows, so a crashed run keeps its finished rows.
+  debugFraction - In debug mode, the fraction of the pairs (0 to 1)
+                debug images are saved for. The pairs are picked by
+                file name, so reruns pick the same pairs.
+  debugDir - Folder the debug images are saved in. Empty saves them
+                in <image folder>_debug next to the image folder.
 
-Developed and tested with Python 2.7.x and OpenCV 2.4.x.
+Developed and tested with Python 2.7.x and OpenCV 2.4.x as well as
+Python 3.x and OpenCV 4.x.
 
 Written by Kevin Kreher (kmk279@cornell.edu).
 """
@@ -82,6 +138,10 @@ sideScaleFactorintersectX = 244		#pixels
 debugmode = 0
 
 # ADVANCED USERS:
+# Size of the uncropped top images (referenced by samain.py)
+frameWidth = 1920         # pixels
+frameHeight = 1080        # pixels
+sideScaleGridStep = 1     # pixels
 # Top image crops (referenced by samain.py and preproclib.py)
 topCropleft = 300         # pixels
 topCroptop = 300          # pixels
@@ -99,4 +159,23 @@ sideAreaminerror = 100 			# Side Area <= side_Area_min_error
 # Image binary threshold (used with OpenCV function cv2.threshold)
 topthreshValue = 60
 sidethreshVal = 15
+# Color clusters (count1..b5 columns written by samain.py)
+colorClusters = 5 			# Number of most common colors reported
+colorBinSize = 8 			# Channel values per color bin
+# Seed search (salib.py findMaxSizeBounds)
+roiPadding = 20 			# pixels around the seed searched again
+useConnectedComponents = 0 	# 1 picks the largest blob by pixel count
+multiSeed = 0 				# 1 measures every seed in a pair
+# Decoded images kept in memory (saimage.py)
+imageCacheSize = 4 			# images
+cropOnLoad = 0 				# 1 crops uncropped images when they are loaded
+lowMemory = 0 				# 1 keeps as little of each image as possible
+# Pre-processing threads (preproclib.py)
+maxWorkers = 4 				# threads
+prefetchFiles = 8 			# files read ahead
+# Result output (sasink.py)
+resultFlushRows = 50 		# rows
+# Debug images (saved by samain.py when debugmode = 1, see sadebug.py)
+debugFraction = 1.0 		# Fraction of the pairs with debug images
+debugDir = '' 				# Empty: <image folder>_debug
 # !! Read documentation before making changes to this file !!
@@ -0,0 +1,211 @@
+""" sadebug.py - Debug images for the seed analyzer scripts.
+
+With debugmode = 1 in saconfig.py samain.py saves a contact sheet for
+each analyzed pair (or a sampled fraction of them, see debugFraction)
+showing the threshold masks, the contours and boxes found and the
+measurements. The images are drawn on copies and rendered and written
+by a background thread, so the analysis neither waits for a key press
+nor for the PNG encoder and runs on machines without a display.
+
+    writer = get_writer()
+    writer.submit(sheetPath, pair_panels, info)
+
+Each process has its own writer, it is flushed when the process exits
+(also in multiprocessing pool workers) or when close_writer() is
+called. Developed and tested with Python 2.7.x and OpenCV 2.4.x as
+well as Python 3.x and OpenCV 4.x.
+"""
+
+import os
+import sys
+import hashlib
+import threading
+import traceback
+import multiprocessing.util
+import numpy as np
+import cv2
+import saconfig as sacfg
+import salib
+import sacompat
+
+PANEL_HEIGHT = 240 # pixels, every panel is scaled to this height
+PANEL_MAX_WIDTH = 720 # pixels
+SHEET_COLUMNS = 3
+SEED_PADDING = 50 # pixels shown around the seed in the overlays
+
+def sampled(fileName, fraction=None):
+    """ Returns True if debug images are wanted for fileName.
+
+    The choice only depends on the file name, so all worker processes
+    and repeated runs pick the same images.
+    """
+    if fraction is None:
+        fraction = sacfg.debugFraction
+    if fraction >= 1:
+        return True
+    digest = hashlib.md5(os.path.basename(fileName).encode('utf-8'))
+    return int(digest.hexdigest()[:8], 16) < fraction * 0x100000000
+
+def sheet_path(top_fileName, seedIndex=None):
+    """ Returns the contact sheet path of a top image (of one of its
+    seeds if seedIndex is given), in debugDir or in
+    <image directory>_debug if debugDir is empty.
+    """
+    directory = sacfg.debugDir
+    if not directory:
+        directory = os.path.dirname(os.path.abspath(top_fileName)) + '_debug'
+    name = os.path.splitext(os.path.basename(top_fileName))[0]
+    if seedIndex is not None:
+        name += '_seed' + str(seedIndex)
+    return os.path.join(directory, name + '_debug.png')
+
+class DebugWriter(object):
+    """ Renders and writes contact sheets in a background thread.
+
+    maxQueued - pairs waiting to be written before submit() blocks,
+                this bounds the memory held by the queue
+    """
+    def __init__(self, maxQueued=16):
+        self._queue = sacompat.queue.Queue(maxQueued)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        self._closed = False
+
+    def submit(self, path, render, *args):
+        """ Queues a contact sheet, render(*args) is called in the
+        background thread and returns a list of (title, image).
+        """
+        self._queue.put((path, render, args))
+
+    def close(self):
+        """ Writes everything still queued and stops the thread.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, render, args = item
+            try:
+                directory = os.path.dirname(path)
+                if directory and not os.path.isdir(directory):
+                    try:
+                        os.makedirs(directory)
+                    except OSError:
+                        pass # Created by another worker meanwhile.
+                cv2.imwrite(path, contact_sheet(render(*args)))
+            except Exception:
+                # A broken debug image must not stop the analysis.
+                sys.stderr.write('Could not write debug image ' + path + '\n')
+                traceback.print_exc()
+
+_writer = None
+_writerLock = threading.Lock()
+
+def get_writer():
+    """ Returns the DebugWriter of this process, creating it on first
+    use.
+    """
+    global _writer
+    with _writerLock:
+        if _writer is None:
+            _writer = DebugWriter()
+            # Runs when the process exits, pool workers included.
+            multiprocessing.util.Finalize(_writer, _writer.close,
+                                          exitpriority=10)
+        return _writer
+
+def close_writer():
+    """ Writes all queued debug images of this process.
+    """
+    global _writer
+    with _writerLock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+def contact_sheet(panels):
+    """ Returns one B,G,R image with the (title, image) panels scaled to
+    the same height and laid out in rows of SHEET_COLUMNS.
+    """
+    scaled = []
+    for title, image in panels:
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        height, width = image.shape[:2]
+        scale = min(float(PANEL_HEIGHT) / height,
+                    float(PANEL_MAX_WIDTH) / width)
+        size = (max(int(width * scale), 1), max(int(height * scale), 1))
+        panel = np.zeros((PANEL_HEIGHT + 20, size[0], 3), np.uint8)
+        panel[20:20 + size[1]] = cv2.resize(image, size,
+                                            interpolation=cv2.INTER_AREA)
+        cv2.putText(panel, title, (4, 14), cv2.FONT_HERSHEY_SIMPLEX, .45,
+                    (255, 255, 255))
+        scaled.append(panel)
+    rows = [scaled[i:i + SHEET_COLUMNS]
+            for i in range(0, len(scaled), SHEET_COLUMNS)]
+    sheetWidth = max(sum(panel.shape[1] + 4 for panel in row) for row in rows)
+    sheet = np.zeros((len(rows) * (PANEL_HEIGHT + 24), sheetWidth, 3),
+                     np.uint8)
+    for rowNumber, row in enumerate(rows):
+        top = rowNumber * (PANEL_HEIGHT + 24)
+        left = 0
+        for panel in row:
+            sheet[top:top + panel.shape[0],
+                  left:left + panel.shape[1]] = panel
+            left += panel.shape[1] + 4
+    return sheet
+
+def threshold_mask(imageBW, thrVal):
+    """ Returns the binary image the seed is searched in (as in
+    findMaxSizeBounds, closed once with a 5x5 kernel).
+    """
+    unused, thresh = cv2.threshold(imageBW, thrVal, 255, cv2.THRESH_BINARY)
+    return salib.erodeAndDilate(thresh, np.ones((5, 5), np.uint8), 1)
+
+def seed_overlay(imageColor, contour, center=None):
+    """ Returns a copy of the region around a seed with its contour and
+    bounding box drawn in red and its center point in green.
+    """
+    image = imageColor.copy()
+    box = sacompat.box_points(cv2.minAreaRect(contour)).astype(np.intp)
+    cv2.drawContours(image, [contour], 0, (0, 0, 255), 1)
+    cv2.drawContours(image, [box], 0, (0, 0, 255), 1)
+    if center is not None:
+        cv2.circle(image, center, 2, (0, 255, 0), -1)
+        cv2.putText(image, 'ctr', center, cv2.FONT_HERSHEY_SIMPLEX, .5,
+                    (0, 255, 0))
+    x, y, w, h = cv2.boundingRect(contour)
+    return image[max(y - SEED_PADDING, 0):y + h + SEED_PADDING,
+                 max(x - SEED_PADDING, 0):x + w + SEED_PADDING]
+
+def text_panel(lines):
+    """ Returns an image with the given lines of text.
+    """
+    panel = np.zeros((20 * len(lines) + 10, PANEL_MAX_WIDTH, 3), np.uint8)
+    for i, line in enumerate(lines):
+        cv2.putText(panel, line, (10, 20 * (i + 1)),
+                    cv2.FONT_HERSHEY_SIMPLEX, .5, (0, 0, 255))
+    return panel
+
+def pair_panels(info):
+    """ Returns the contact sheet panels of one analyzed pair.
+
+    info is the dictionary built by samain.analyzeSeedPair() with the
+    images, thresholds, seed contours and measurement text.
+    """
+    return [('top', seed_overlay(info['topColor'], info['topContour'],
+                                 info['topCenter'])),
+            ('top threshold', threshold_mask(info['topRotated'],
+                                             info['topThresh'])),
+            ('side', seed_overlay(info['sideColor'], info['sideContour'])),
+            ('side threshold', threshold_mask(info['sideBW'],
+                                              info['sideThresh'])),
+            ('measurements', text_panel(info['text']))]
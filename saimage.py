@@ -0,0 +1,136 @@
+""" saimage.py - Image loading shared by the seed analyzer scripts.
+
+Every image file is decoded once: the grayscale image is derived from
+the decoded color image with cv2.cvtColor instead of decoding the file
+a second time. Decoded images are kept in a small LRU cache keyed by
+path and modification time, and image sizes are read from the file
+header only. Used by samain.py and preproclib.py. Developed and tested
+with Python 2.7.x and OpenCV 2.4.x as well as Python 3.x and OpenCV
+4.x.
+"""
+
+import os
+import threading
+import collections
+import cv2
+import numpy as np
+from PIL import Image
+import saconfig as sacfg
+
+class LRUCache(object):
+    """ Small thread safe least-recently-used cache.
+
+    maxsize - number of entries kept, 0 disables the cache
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self._entries[key] = value # Most recently used last.
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_images = LRUCache(sacfg.imageCacheSize)
+_sizes = LRUCache(1024)
+
+def file_key(path):
+    """ Returns the cache key of a file, its absolute path and mtime.
+    """
+    return (os.path.abspath(path), os.path.getmtime(path))
+
+def image_size(path):
+    """ Returns (width, height) of an image file.
+
+    Only the file header is read (PIL opens images lazily), the pixels
+    are never decoded.
+    """
+    key = file_key(path)
+    size = _sizes.get(key)
+    if size is None:
+        with Image.open(path) as im:
+            size = im.size
+        _sizes.put(key, size)
+    return size
+
+def load_image(path, box=None):
+    """ Returns (color, gray) for an image file, decoding it only once.
+
+    color is the B,G,R image as returned by cv2.imread(path, 1) and
+    gray is derived from it with cv2.cvtColor. The arrays are shared
+    with the cache, copy them before drawing on them. With a box only
+    that part of the image is kept: it is copied out right after
+    decoding, so the full frame is freed at once and the gray image is
+    only made for the box. Nothing is cached in low memory mode
+    (lowMemory = 1 in saconfig).
+
+    path - image file to load
+    box - (left, top, right, bottom) to crop to; right/bottom may be
+          None for the image edge; None keeps the whole image
+    """
+    key = file_key(path)
+    images = _images.get(key + (box,))
+    if images is None:
+        color = cv2.imread(path, cv2.IMREAD_COLOR)
+        if color is None:
+            raise IOError('Could not read image: ' + path)
+        _sizes.put(key, (color.shape[1], color.shape[0]))
+        if box is not None:
+            left, top, right, bottom = box
+            color = color[top:bottom, left:right].copy()
+        gray = cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+        images = (color, gray)
+        # May be overridden later.
+        _images.maxsize = 0 if sacfg.lowMemory else sacfg.imageCacheSize
+        _images.put(key + (box,), images)
+    return images
+
+def load_color(path):
+    """ Returns the B,G,R image of an image file (see load_image).
+    """
+    return load_image(path)[0]
+
+def load_gray(path):
+    """ Returns the grayscale image of an image file (see load_image).
+    """
+    return load_image(path)[1]
+
+def decode_color(data, path=''):
+    """ Returns the B,G,R image of the content of an image file, the same
+    image cv2.imread(path, 1) returns. Not cached.
+    """
+    return _decode(data, path, cv2.IMREAD_COLOR)
+
+def decode_gray(data, path=''):
+    """ Returns the grayscale image of the content of an image file, the
+    same image cv2.imread(path, 0) returns. Not cached.
+    """
+    return _decode(data, path, cv2.IMREAD_GRAYSCALE)
+
+def _decode(data, path, flags):
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+    if image is None:
+        raise IOError('Could not read image: ' + path)
+    return image
+
+def clear_cache():
+    """ Drops all cached images and sizes.
+    """
+    _images.clear()
+    _sizes.clear()
@@ -2,7 +2,8 @@
 
 A library full of functions used in the main seed analyzing script.
 Each function has an associated Docstring explaining the functionality.
-Developed and tested with Python 2.7.x and OpenCV 2.4.x.
+Developed and tested with Python 2.7.x and OpenCV 2.4.x as well as
+Python 3.x and OpenCV 4.x (see sacompat.py).
 
 Written by Kevin Kreher (kmk279@cornell.edu).
 """
@@ -14,20 +15,52 @@ import cv2
 import math
 import glob
 import copy
+import threading
+import saprofile
+import sacompat
 
-def rotateImage(src,angl,midpt):
-	""" Returns an image rotated around a midpoint.
+_buffers = threading.local()
+
+def _maskBuffer(shape):
+    """ Returns an uninitialized uint8 image of the given shape. The
+    memory is reused by the calling thread for every later mask, so
+    searching many images does not allocate a new mask each time.
+    """
+    size = shape[0]*shape[1]
+    buffer = getattr(_buffers,'mask',None)
+    if buffer is None or buffer.size < size:
+        buffer = np.empty(size,np.uint8)
+        _buffers.mask = buffer
+    return buffer[:size].reshape(shape)
+
+@saprofile.timed()
+def rotateImage(src,angl,midpt,roi=None):
+    """ Returns an image rotated around a midpoint.
+
+    With a roi only that region of the rotated image is computed and
+    returned, which is cheaper than rotating a full frame.
+    Positions in the returned image are then relative to the top left
+    corner of the roi. The pixels are the same as those of the full
+    rotated image: warpAffine() rounds the source position of every
+    pixel by its column, so the columns are computed from 0 (and cut
+    to the roi afterwards) and only the rows start at the roi.
 
     src - The image to be rotated
     angl - the angle to rotate the image by around the midpoint
     midpt - midpoint to rotate about
+    roi - (x,y,w,h) region to rotate, see seedRoi(), None for all
     """
-	rows,cols = src.shape[:2]
-	M = cv2.getRotationMatrix2D((midpt[0],midpt[1]),angl,1)
-	imgRot = cv2.warpAffine(src,M,(cols,rows))
-	return imgRot
-
-def findMaxSizeBounds(imgBW,thrVal):
+    M = cv2.getRotationMatrix2D((midpt[0],midpt[1]),angl,1)
+    if roi is None:
+        rows,cols = src.shape[:2]
+        return cv2.warpAffine(src,M,(cols,rows))
+    x,y,w,h = roi
+    M[1,2] -= y # Row y of the rotated image is row 0 of the result.
+    imgRot = cv2.warpAffine(src,M,(x+w,h))
+    return imgRot[:,x:]
+
+@saprofile.timed()
+def findMaxSizeBounds(imgBW,thrVal,useComponents=False):
     """ Returns the bounding info of the max sized object in the image.
 
     The bouding information is returned in a dictionary containing:
@@ -36,29 +69,244 @@ def findMaxSizeBounds(imgBW,thrVal):
     'indexSeed' - the index position of the largest object in the image
     by area.
     The algorithm finds the object with the maximimum area by
-    thresholding the given B/W image and searching through all found
-    blobs in the image.
+    thresholding the given B/W image and searching through the outer
+    contours of all found blobs in the image. Holes inside blobs are
+    never the largest object, so their contours are not built. When
+    useComponents is set (and OpenCV provides it) the largest blob is
+    picked by pixel count with cv2.connectedComponentsWithStats and
+    only its outline is traced. The thresholded image is built in a
+    buffer reused by the thread (see _maskBuffer()).
 
     imgBW - black and white image containing the seed
     thrVal - value to use for thresholding operation
+    useComponents - pick the largest blob with connected components
     """
-    x,imageThreshed = cv2.threshold(imgBW,thrVal,255,cv2.THRESH_BINARY)
-    imageThreshed = erodeAndDilate(imageThreshed,np.ones((5,5)),1)
-    imageContour = copy.copy(imageThreshed) # Copy for operating on
-    contours, hierarchy = cv2.findContours(imageContour,cv2.RETR_TREE,
-                                           cv2.CHAIN_APPROX_SIMPLE)
-    i = 0
-    largest = 0
+    imageThreshed = _threshedMask(imgBW,thrVal)
+    if useComponents and hasattr(cv2,'connectedComponentsWithStats'):
+        count,labels,stats,centroids = cv2.connectedComponentsWithStats(
+            imageThreshed,connectivity=8)
+        contours = []
+        if count > 1:
+            # Label 0 is the background.
+            label = 1+np.argmax(stats[1:,cv2.CC_STAT_AREA])
+            bx,by,bw,bh = stats[label,:4]
+            blob = np.uint8(labels[by:by+bh,bx:bx+bw] == label)*255
+            contours, hierarchy = sacompat.find_contours(
+                blob,cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_SIMPLE,(bx,by))
+    else:
+        contours = _outerContours(imageThreshed)
     largestIndex = 0
-    while i < len(contours):
-		area = cv2.contourArea(contours[i])
-		if area > largest:
-			largest = area
-			largestIndex = i
-		i += 1
+    if len(contours) > 1:
+        # The first contour of maximum area, as the old loop did.
+        largestIndex = int(np.argmax([cv2.contourArea(contour)
+                                      for contour in contours]))
     return {'seedIndex':largestIndex, 'contourList':contours}
 
-def findLengthWidth(workingImgBW,thrVal):
+def _threshedMask(imgBW,thrVal):
+    """ Returns the thresholded image the seeds are searched in, built
+    in the buffer of the thread (see _maskBuffer()).
+    """
+    imageThreshed = _maskBuffer(imgBW.shape[:2])
+    cv2.threshold(imgBW,thrVal,255,cv2.THRESH_BINARY,imageThreshed)
+    # Same as erodeAndDilate(imageThreshed,np.ones((5,5)),1), in place.
+    cv2.morphologyEx(imageThreshed,cv2.MORPH_CLOSE,np.ones((5,5)),
+                     imageThreshed)
+    return imageThreshed
+
+def _outerContours(imageThreshed):
+    """ Returns the outer contours of the blobs in a thresholded image.
+    """
+    # The thresholded image is not used again, so findContours may
+    #    operate on it directly.
+    contours, hierarchy = sacompat.find_contours(imageThreshed,
+                                                 cv2.RETR_EXTERNAL,
+                                                 cv2.CHAIN_APPROX_SIMPLE)
+    return contours
+
+@saprofile.timed()
+def findAllSeedBounds(imgBW,thrVal,minArea,maxArea):
+    """ Returns the bounding info of every seed sized object in the image.
+
+    The objects are found as in findMaxSizeBounds(), but instead of the
+    largest one all objects with minArea < area < maxArea are seeds.
+    The bounding information is returned in a dictionary containing:
+    'contourList' - a list containing the outer countours of all
+    objects in the image.
+    'seedIndices' - the index positions of the seeds in contourList,
+    ordered from left to right.
+    'centers' - the (x,y) center of the bounding box of each seed, in
+    the order of seedIndices.
+
+    imgBW - black and white image containing the seeds
+    thrVal - value to use for thresholding operation
+    minArea - objects of this area (pixels) or less are not seeds
+    maxArea - objects of this area (pixels) or more are not seeds
+    """
+    contours = _outerContours(_threshedMask(imgBW,thrVal))
+    seeds = []
+    for index,contour in enumerate(contours):
+        if minArea < cv2.contourArea(contour) < maxArea:
+            seeds.append((cv2.minAreaRect(contour)[0],index))
+    seeds.sort()
+    return {'contourList':contours,
+            'seedIndices':[index for center,index in seeds],
+            'centers':[center for center,index in seeds]}
+
+class SideScaleCalibration(object):
+    """ Side scale factors of calcSideScaleFactor() from a table.
+
+    The distance of a seed from the side camera only depends on its
+    position in the top image, so it is computed once for a grid over
+    the whole (cropped) top image and looked up for each seed by
+    bilinear interpolation. With a step of 1 the grid points are the
+    pixel positions, which is where findLengthWidth() puts the center,
+    and the lookup is exact. The law of cosines of calcSideScaleFactor()
+    simplifies to b**2 = X**2 + (Y+d)**2 (cos(phi+90 degrees) = -Y/a),
+    which has no division by X. The correction for seeds angled by 45
+    degrees or more only depends on the seed and is added afterwards.
+
+    frameSize - (width, height) of the uncropped top image in pixels
+    cropleft, croptop, topScale, eqM, eqB, xIntersect, distCamera_in,
+    distCamera_angle - see calcSideScaleFactor()
+    step - grid spacing in pixels
+    """
+    def __init__(self,frameSize,cropleft,croptop,topScale,eqM,eqB,
+                 xIntersect,distCamera_in,distCamera_angle,step=1):
+        self.topScale = topScale
+        self.eqM = eqM
+        self.eqB = eqB
+        self.step = step
+        distCamera_angle_rad = distCamera_angle*(math.pi/180)
+        distCamera = 2.54*distCamera_in/topScale
+        self._distCamera_y = distCamera*math.sin(distCamera_angle_rad)
+        self._xIntersect = xIntersect
+        self._yimgsize = frameSize[1]-croptop
+        xs = np.arange(0,frameSize[0]-cropleft+step,step,dtype=np.float64)
+        ys = np.arange(0,self._yimgsize+step,step,dtype=np.float64)
+        self.grid = self._distance(xs[np.newaxis,:],ys[:,np.newaxis])
+
+    def _distance(self,x,y):
+        """ Returns the distances (inches) of top image positions from
+        the side camera.
+        """
+        X = np.abs(x-self._xIntersect)
+        Y = np.abs(self._yimgsize-y)
+        b = np.sqrt(X**2+(Y+self._distCamera_y)**2) # pixels
+        return b*self.topScale/2.54
+
+    def distances(self,centers):
+        """ Returns the distances (inches) of seed centers from the side
+        camera, centers is a sequence of (x,y) in the cropped top image.
+        """
+        centers = np.asarray(centers,dtype=np.float64).reshape(-1,2)
+        gridX = centers[:,0]/self.step
+        gridY = centers[:,1]/self.step
+        rows,cols = self.grid.shape
+        x0 = np.clip(np.floor(gridX).astype(np.intp),0,cols-2)
+        y0 = np.clip(np.floor(gridY).astype(np.intp),0,rows-2)
+        fx = gridX-x0
+        fy = gridY-y0
+        grid = self.grid
+        top = grid[y0,x0]*(1-fx)+grid[y0,x0+1]*fx
+        bottom = grid[y0+1,x0]*(1-fx)+grid[y0+1,x0+1]*fx
+        values = top*(1-fy)+bottom*fy
+        # Centers off the grid (outside the frame) are computed directly.
+        outside = ((gridX < 0) | (gridY < 0) | (gridX > cols-1) |
+                   (gridY > rows-1))
+        if outside.any():
+            values[outside] = self._distance(centers[outside,0],
+                                             centers[outside,1])
+        return values
+
+    def scaleFactors(self,centers,seedAngles_deg,seedLengths_top):
+        """ Returns the side scale factors (cm/pixel) of many seeds.
+
+        centers - (x,y) seed center points in the cropped top image
+        seedAngles_deg - seed angles, see calcSideScaleFactor()
+        seedLengths_top - seed lengths in the top image in pixels
+        """
+        b_in = self.distances(centers)
+        angles = np.asarray(seedAngles_deg,dtype=np.float64)
+        lengths = np.asarray(seedLengths_top,dtype=np.float64)
+        # Optical skew of seeds at extreme angles, see
+        #    calcSideScaleFactor().
+        lengthCorr_in = (lengths/4)*self.topScale/2.54
+        b_in = np.where(np.abs(angles) >= 45,b_in+lengthCorr_in,b_in)
+        return b_in*self.eqM+self.eqB
+
+    def scaleFactor(self,centerpoint,seedAngle_deg,seedLength_top):
+        """ Returns the side scale factor (cm/pixel) of one seed.
+        """
+        return float(self.scaleFactors([centerpoint],[seedAngle_deg],
+                                        [seedLength_top])[0])
+
+def matchSeeds(topCenters,topWidth,sideCenters,sideWidth):
+    """ Returns the side seed matching each top seed.
+
+    Both views see the seeds in the same order along the x-axis. If
+    both found the same number of seeds they are matched in order,
+    otherwise each top seed is matched to the closest unmatched side
+    seed by x position relative to the image width, closest pairs
+    first. The result is a list with the position in sideCenters of
+    the match of every top seed, or None if it has none.
+
+    topCenters - (x,y) centers of the top seeds, left to right
+    topWidth - width of the top image (pixels)
+    sideCenters - (x,y) centers of the side seeds, left to right
+    sideWidth - width of the side image (pixels)
+    """
+    if len(topCenters) == len(sideCenters):
+        return list(range(len(topCenters)))
+    matches = [None]*len(topCenters)
+    if len(topCenters) == 0 or len(sideCenters) == 0:
+        return matches
+    topX = np.array([center[0] for center in topCenters])/float(topWidth)
+    sideX = np.array([center[0] for center in sideCenters])/float(sideWidth)
+    distances = np.abs(topX[:,np.newaxis]-sideX[np.newaxis,:])
+    used = set()
+    for flat in np.argsort(distances,axis=None,kind='mergesort'):
+        topIndex,sideIndex = divmod(int(flat),len(sideCenters))
+        if matches[topIndex] is None and sideIndex not in used:
+            matches[topIndex] = sideIndex
+            used.add(sideIndex)
+    return matches
+
+def isolateSeed(imgBW,contours,index):
+    """ Returns a copy of a B/W image in which every object except
+    contours[index] is black, so the largest object findLengthWidth()
+    and findVolume() find is that seed.
+
+    imgBW - black and white image containing the seeds
+    contours - contourList of findAllSeedBounds()
+    index - index of the seed to keep
+    """
+    isolated = imgBW.copy()
+    others = [contour for i,contour in enumerate(contours) if i != index]
+    cv2.drawContours(isolated,others,-1,0,-1)
+    return isolated
+
+def seedRoi(contour,center,imageShape,pad):
+    """ Returns a region (x,y,w,h) around a seed for later searches.
+
+    The region is a square around center that contains the contour
+    even after the image is rotated about center, plus pad pixels on
+    every side, clipped to the image.
+
+    contour - contour of the seed
+    center - (x,y) point the image may be rotated about
+    imageShape - shape of the image
+    pad - extra pixels around the seed
+    """
+    points = contour.reshape(-1,2).astype(np.float64)
+    radius = np.sqrt(((points-center)**2).sum(axis=1)).max()
+    half = int(math.ceil(radius))+pad
+    x0 = max(int(center[0])-half,0)
+    y0 = max(int(center[1])-half,0)
+    x1 = min(int(center[0])+half+1,imageShape[1])
+    y1 = min(int(center[1])+half+1,imageShape[0])
+    return (x0,y0,max(x1-x0,0),max(y1-y0,0))
+
+def findLengthWidth(workingImgBW,thrVal,useComponents=False):
     """ Returns information about the largest object in an image.
 
     The information returned is a list of info about the largest object
@@ -69,8 +317,9 @@ def findLengthWidth(workingImgBW,thrVal):
 
     workingImgBW - B/W image with seed to find length and width of
     thrVal - value to use for thresholding operation
+    useComponents - see findMaxSizeBounds()
     """
-    seedBounds = findMaxSizeBounds(workingImgBW,thrVal)
+    seedBounds = findMaxSizeBounds(workingImgBW,thrVal,useComponents)
     largestIndex = seedBounds['seedIndex']
     contours = seedBounds['contourList']
     if len(contours) == 0:
@@ -78,35 +327,67 @@ def findLengthWidth(workingImgBW,thrVal):
         return {'length':1, 'width':1, 'angle':0,
                 'center':(1,1), 'area':1, 'largestIndex':0,
                 'contours':[np.array([[[1, 1]]], dtype=np.int32)]}
-    bounds = cv2.minAreaRect(contours[largestIndex])
-    box = cv2.cv.BoxPoints(bounds) # Create a rotated rectangle
-    box = np.int0(box) # The box has four corners
-    # A = midpoint of points at box[0] and box[1]
-    A = ((box[0][0]+box[1][0])/2 , (box[0][1]+box[1][1])/2)
-    # B = midpoint of box[1] and box[2]
-    B = ((box[1][0]+box[2][0])/2 , (box[1][1]+box[2][1])/2)
-    # C = midpoint of box[2] and box[3]
-    C = ((box[2][0]+box[3][0])/2 , (box[2][1]+box[3][1])/2)
-    # D = midpoint of box[3] and box[0]
-    D = ((box[3][0]+box[0][0])/2 , (box[3][1]+box[0][1])/2)
-    # center = midpoints of A-C line and B-D
-    centerPoint = ((B[0]+D[0])/2 , (A[1]+C[1])/2)
-    # Calculate geometry - length, width, area
+    geometry = boxGeometry(contourRects([contours[largestIndex]]))
     areaTop = cv2.contourArea(contours[largestIndex])
-    distance1 = math.sqrt(math.pow(B[0]-D[0],2)+math.pow(B[1]-D[1],2))
-    distance2 = math.sqrt(math.pow(A[0]-C[0],2)+math.pow(A[1]-C[1],2))
-    if distance1 > distance2:
-        length = distance1 # Length will be the longer distance always
-        width = distance2
-        rotateAngle = 90+bounds[2]
-    else:
-        length = distance2
-        width = distance1
-        rotateAngle = bounds[2]
-    return {'length':length, 'width':width, 'angle':rotateAngle,
+    centerPoint = (int(geometry['center'][0,0]),int(geometry['center'][0,1]))
+    return {'length':float(geometry['length'][0]),
+            'width':float(geometry['width'][0]),
+            'angle':float(geometry['angle'][0]),
             'center':centerPoint, 'area':areaTop, 'largestIndex':largestIndex,
             'contours':contours}
 
+def contourRects(contours):
+    """ Returns the cv2.minAreaRect() of every contour as an (N,5) array
+    of center x, center y, width, height and angle (degrees).
+    """
+    rects = np.zeros((len(contours),5))
+    for i,contour in enumerate(contours):
+        (x,y),(w,h),angle = cv2.minAreaRect(contour)
+        rects[i] = (x,y,w,h,angle)
+    return rects
+
+def boxGeometry(rects):
+    """ Returns the length, width, angle and center of many rotated
+    rectangles at once.
+
+    This is the geometry findLengthWidth() reports for a seed, worked
+    out for N rectangles. The corners of each rectangle are taken from
+    cv2.boxPoints() and cut to whole pixels, the rest is done with
+    numpy for all rectangles at once. A-D are the midpoints of the four sides (integer
+    division), the distances between opposite midpoints are the length
+    (the longer one) and the width, and the center is the crossing of
+    the A-C and B-D lines. The angle is the one to rotate by so the
+    length lies along the x-axis. The results are identical to
+    computing every rectangle on its own.
+
+    The values are returned in a dictionary of arrays containing:
+    'length', 'width' and 'angle' - (N,) floats
+    'center' - (N,2) integer x,y
+
+    rects - (N,5) array of minAreaRect() results (see contourRects())
+    """
+    rects = np.asarray(rects,dtype=np.float64).reshape(-1,5)
+    # Corners 0-3 of every box, x in [:,:,0] and y in [:,:,1], cut to
+    #    whole pixels as np.int0() does. They come from cv2.boxPoints()
+    #    itself, its float rounding decides which pixel a corner on a
+    #    pixel border is cut to.
+    box = np.array([sacompat.box_points(((x,y),(w,h),angle))
+                    for x,y,w,h,angle in rects],
+                   dtype=np.float32).reshape(-1,4,2).astype(np.intp)
+    A = (box[:,0]+box[:,1])//2 # Midpoint of box[0] and box[1]
+    B = (box[:,1]+box[:,2])//2 # Midpoint of box[1] and box[2]
+    C = (box[:,2]+box[:,3])//2 # Midpoint of box[2] and box[3]
+    D = (box[:,3]+box[:,0])//2 # Midpoint of box[3] and box[0]
+    center = np.column_stack(((B[:,0]+D[:,0])//2,(A[:,1]+C[:,1])//2))
+    distance1 = np.sqrt(((B-D)**2).sum(axis=1).astype(np.float64))
+    distance2 = np.sqrt(((A-C)**2).sum(axis=1).astype(np.float64))
+    # Length will be the longer distance always.
+    longer = distance1 > distance2
+    return {'length':np.where(longer,distance1,distance2),
+            'width':np.where(longer,distance2,distance1),
+            'angle':np.where(longer,90+rects[:,4],rects[:,4]),
+            'center':center}
+
 def pixelSizeCalibrate(imgBW,thrVal,modelLength,modelWidth):
     """ Returns conversion from pixel to centimeter lengths.
 
@@ -188,8 +469,9 @@ def erodeAndDilate(image, kernel, timesRepeated):
     image2 = cv2.erode(image1, kernel, iterations = timesRepeated)
     return image2
 
+@saprofile.timed()
 def findVolume(topimage,sideimage,topImgVariables,sideImgVariables,
-               threshSideVal,topScale,sideScale):
+               threshSideVal,topScale,sideScale,pad=10):
     """ Returns the volume of a specified object in cm^3.
 
     The algorithm works by using known blob (seed) and image paramters
@@ -210,13 +492,16 @@ def findVolume(topimage,sideimage,topImgVariables,sideImgVariables,
     y(z) is the side image blob width at pt z (in cm)
     dz is the width of each pixel (in cm)
 
-    topimage - the top image of the seed
+    topimage - the top image of the seed (the seed itself is taken from
+               the contours in topImgVariables)
     sideimage - the side image of the seed
     topImgVariables - variables defining the top seed
     sideImgVariables - variables defining the side seed
     threshSideVal - value to use for thresholding operation
     topScale - scale factor for top image (cm/pixel)
     sideScale - scale factor for side image (cm/pixel)
+    pad - rows kept above and below the side seed when it is cut out
+          of the side image for resizing
     """
     topLength = topImgVariables['length']
     topWidth = topImgVariables['width']
@@ -226,67 +511,87 @@ def findVolume(topimage,sideimage,topImgVariables,sideImgVariables,
     topLargestIndex = topImgVariables['largestIndex'] 
     topContours = topImgVariables['contours']
     sideLength = sideImgVariables['length']
+    sideLargestIndex = sideImgVariables['largestIndex']
+    sideContours = sideImgVariables['contours']
 
     # Correct for different length of top and side image of blob or
     #    see by resizing the side image by a factor to make the
     #    lengths equal. Length is assumed to lie along the x-axis.
-    #    Side variables are then recalculated.
+    #    Only the rows around the side seed are resized, then the side
+    #    variables are recalculated within them. The resize does not
+    #    scale vertically, so this gives exactly the rows a resize of
+    #    the whole image would give.
     #    vol_length_SideScaleFactor - units are pixels/pixels
     vol_length_SideScaleFactor = float(topLength)/float(sideLength)
-    sideResizedImage = cv2.resize(sideimage,None,
+    x,y,w,h = cv2.boundingRect(sideContours[sideLargestIndex])
+    sideSeedImage = sideimage[max(y-pad,0):y+h+pad]
+    sideResizedImage = cv2.resize(sideSeedImage,None,
                                   fx=vol_length_SideScaleFactor,fy=1)
     sideResizedImgVariables = findLengthWidth(sideResizedImage,threshSideVal)
-    sideResizedLargestIndex = sideResizedImgVariables['largestIndex'] 
+    sideResizedLargestIndex = sideResizedImgVariables['largestIndex']
     sideResizedContours = sideResizedImgVariables['contours']
-    sideResizedCenterPoint = sideResizedImgVariables['center']
-
-    # Mask images that contain the contours filled in (top and side).
-    topimg = np.zeros_like(topimage) 
-    cv2.drawContours(topimg,topContours,topLargestIndex,255,-1)
-    sideimg = np.zeros_like(sideResizedImage)
-    cv2.drawContours(sideimg,sideResizedContours,
-                     sideResizedLargestIndex,255,-1)
-
-    # Rotate by 90 degrees and create a list of pixels for clarity
-    #    before passing to ellipseAxes.
-    #    ellipseAxes() will return a list of blob (seed) cross-section
+
+    # Masks that contain the contours filled in (top and side), only as
+    #    large as the seeds themselves.
+    topimg = contourMask(topContours[topLargestIndex])
+    sideimg = contourMask(sideResizedContours[sideResizedLargestIndex])
+
+    # Rotate by 90 degrees before measuring the masks row by row.
+    #    maskAxes() will return a list of blob (seed) cross-section
     #    measurements along both side and top image axes. If refering
     #    the simple equation for ellipse area above, this function is
     #    returning 2*a and 2*b for each ellipse that will be used in
     #    the summation.
     topimg = cv2.transpose(topimg)
     sideimg = cv2.transpose(sideimg)
-    topPts = np.where(topimg == 255)
-    sidePts = np.where(sideimg == 255)
-    axesMeasurements = ellipseAxes(topPts,sidePts)
+    axesMeasurements = (maskAxes(topimg),maskAxes(sideimg))
 
     # The algorithm uses all available integration points (pixels)
     #    but in some cased the length of either the top or
     #    resized side image rounds incorrectly and the lengths
     #    do not match - dropping a shell of negligible size at the far
-    #    end of a blob (seed) fixes this. After this the loop variables
-    #    used in the Riemann sum are declared.
-    lenTop = len(axesMeasurements[0])
-    lenSide = len(axesMeasurements[1])
-    integrate_over = 0
-    if lenSide < lenTop:
-        integrate_over = lenSide
-    else:
-        integrate_over = lenTop
+    #    end of a blob (seed) fixes this. The Riemann sum is then a
+    #    single dot product of the halved (integer) axis diameters.
+    integrate_over = min(len(axesMeasurements[0]),len(axesMeasurements[1]))
+    aaxis = axesMeasurements[0][:integrate_over]//2 # Top semi-axes, pixels
+    baxis = axesMeasurements[1][:integrate_over]//2 # Side semi-axes, pixels
     dz = topScale # Pixel width, using topimage as the standard
-    i = 0
-    summation = 0.0
-    while i < integrate_over:
-        aaxis = axesMeasurements[0][i] # Top axis diameter in pixels
-        baxis = axesMeasurements[1][i] # Side axis diameter in pixels
-        ellipseArea = math.pi*(aaxis/2)*(baxis/2) # pixels
-        ellipseArea_scaled = ellipseArea*topScale*sideScale # cm^2
-        summation += ellipseArea_scaled*dz # cm^3
-        i += 1
-    return summation
+    ellipseAreaSum = math.pi*np.dot(aaxis,baxis) # pixels
+    summation = ellipseAreaSum*topScale*sideScale*dz # cm^3
+    return float(summation)
+
+def contourMask(contour):
+    """ Returns a mask with a contour filled in (255), the mask covers
+    only the bounding rectangle of the contour.
+
+    contour - contour to fill in
+    """
+    x,y,w,h = cv2.boundingRect(contour)
+    mask = np.zeros((h,w),np.uint8)
+    cv2.drawContours(mask,[contour],0,255,-1,offset=(-x,-y))
+    return mask
+
+def maskAxes(mask):
+    """ Returns the width of the seed in every row of a mask.
+
+    This is ellipseAxes() working directly on a (transposed) mask
+    instead of the np.where coordinate arrays: the width of a row is
+    the distance between its first and last 255 valued pixel. Empty
+    rows are skipped and, like ellipseAxes(), the last occupied row is
+    not measured.
+
+    mask - mask image with the seed filled in with 255
+    """
+    seedPixels = (mask == 255)
+    rows = seedPixels[seedPixels.any(axis=1)]
+    if len(rows) == 0:
+        return np.zeros(0, dtype=np.intp)
+    first = np.argmax(rows,axis=1)
+    last = rows.shape[1]-1-np.argmax(rows[:,::-1],axis=1)
+    return (last-first)[:-1]
 
 def ellipseAxes(numpyTop,numpySide):
-    """ Returns two lists containg lengths of a and b axes.
+    """ Returns two arrays containg lengths of a and b axes.
 
     Given two numpy arrays representing the blob (seed) ellipseAxes
     records the number of rows in each column for both arrays. When
@@ -318,43 +623,70 @@ def ellipseAxes(numpyTop,numpySide):
     or (array([656, 656, 656, ..., 732, 732, 733]),
         array([1073, 1074, 1075, ..., 1081, 1082, 1078]))
     """
-    x = 0 # Indicate which part of the array is x or y axis.
-    y = 1
-    i = 0
-    top = []
-    prevTopPt = numpyTop[x][0]
-    starty = numpyTop[y][0]
-    while i < len(numpyTop[x]):
-        # numpyTop[x] is the array of x values
-        # numpyTop[y] is the array of y values
-        if prevTopPt != numpyTop[x][i]:
-            # If the x value changed, measure how much y has changed.
-            endy = numpyTop[y][i-1]
-            topCalculated = endy-starty
-            top.append(topCalculated)
-            starty = numpyTop[y][i]
-            prevTopPt = numpyTop[x][i]
-        i += 1
-    i = 0
-    side = []
-    prevSidePt = numpySide[x][0]
-    starty = numpySide[y][0]
-    while i < len(numpySide[x]):
-        # numpySide[x] is the array of x values
-        # numpySide[y] is the array of y values
-        if prevSidePt != numpySide[x][i]:
-            # If the x value changed, measure how much y has changed.
-            endy = numpySide[y][i-1]
-            sideCalculated = endy-starty
-            side.append(sideCalculated)
-            starty = numpySide[y][i]
-            prevSidePt = numpySide[x][i]
-        i += 1
-    return (top,side)
+    return (_coordinateAxes(numpyTop),_coordinateAxes(numpySide))
+
+def _coordinateAxes(numpyPts):
+    """ Returns the ellipseAxes() widths for one (x,y) coordinate pair.
+
+    Every position where x changes closes a run of equal x values, the
+    width of that run is its last y minus its first y. The final run
+    is never closed and therefore not measured.
+    """
+    x = np.asarray(numpyPts[0]) # Indicate which part of the array is x
+    y = np.asarray(numpyPts[1]) #    or y axis.
+    changes = np.flatnonzero(x[1:] != x[:-1])+1
+    starts = np.concatenate(([0],changes))[:-1].astype(np.intp)
+    return y[changes-1]-y[starts]
+
+@saprofile.timed()
+def colorStats(image,mask,topN=5,binSize=1):
+    """ Returns color statistics of the seed pixels in a color image.
+
+    The statistics are returned in a dictionary containing:
+    'pixelcount' - the number of pixels under the mask.
+    'red','green','blue' - average value of each channel (integer, the
+    channel sums are divided by pixelcount with integer division).
+    'clusters' - list of up to topN (count,r,g,b) tuples for the most
+    common colors, most common first. Colors are quantized into bins
+    of binSize values per channel and r,g,b is the center of the bin.
+
+    image - B,G,R color image
+    mask - image of the same size with the seed pixels set to 255
+    topN - number of most common colors to return
+    binSize - channel values per color bin (1 = exact colors)
+    """
+    pixels = image[mask == 255] # B,G,R of all seed colored pixels.
+    pixelcount = len(pixels)
+    if pixelcount == 0:
+        return {'pixelcount':0, 'red':0, 'green':0, 'blue':0,
+                'clusters':[]}
+    blue,green,red = pixels.sum(axis=0,dtype=np.int64)//pixelcount
+    # Pack the quantized channels into one key per pixel and count the
+    #    keys. bincount is used while the number of possible keys is
+    #    small, unique (a sort) otherwise.
+    levels = (255//binSize)+1
+    binned = (pixels//binSize).astype(np.int64)
+    keys = (binned[:,2]*levels+binned[:,1])*levels+binned[:,0]
+    if levels**3 <= 1<<21:
+        counts = np.bincount(keys,minlength=levels**3)
+        values = np.flatnonzero(counts)
+        counts = counts[values]
+    else:
+        values,counts = np.unique(keys,return_counts=True)
+    order = np.argsort(-counts,kind='mergesort')[:topN]
+    center = binSize//2
+    clusters = []
+    for value,count in zip(values[order],counts[order]):
+        r = min((value//(levels*levels))*binSize+center,255)
+        g = min(((value//levels)%levels)*binSize+center,255)
+        b = min((value%levels)*binSize+center,255)
+        clusters.append((int(count),int(r),int(g),int(b)))
+    return {'pixelcount':pixelcount, 'red':red, 'green':green,
+            'blue':blue, 'clusters':clusters}
 
 def calcSideScaleFactor(centerpoint,cropleft,croptop,topScale,eqM,eqB,
                         xIntersect,distCamera_in,distCamera_angle,
-                        seedAngle_deg,seedLength_top):
+                        seedAngle_deg,seedLength_top,frameSize=(1920,1080)):
     """ Returns the side scale factor.
 
     Calculates the side scale factor (in units cm/pixel) given
@@ -365,7 +697,8 @@ def calcSideScaleFactor(centerpoint,cropleft,croptop,topScale,eqM,eqB,
     calculator - see documentation on Google Drive) the side scale
     factor is calculated in the last step. If the top image is cropped
     before the centerpoint input is calculated, the script can account
-    for this.
+    for this. SideScaleCalibration gives the same values from a
+    precomputed table.
     
     centerpoint - (x,y) of seed center point
     cropleft - amount left side was cropped by (done in pre-processing)
@@ -382,6 +715,7 @@ def calcSideScaleFactor(centerpoint,cropleft,croptop,topScale,eqM,eqB,
     seedAngle_deg - calculated seed angle in degrees (0 being
                         lengthwise infront of side camera, 90 facing)
     seedLength_top - calculated seed length from top image in pixels
+    frameSize - (width, height) of the uncropped top image in pixels
     """
     # Convert angle from degrees to radians
     distCamera_angle_rad = distCamera_angle*(math.pi/180)
@@ -391,12 +725,10 @@ def calcSideScaleFactor(centerpoint,cropleft,croptop,topScale,eqM,eqB,
 
     # Use blob (seed) centerpoint to calculate the distance in pixels 
     #    from the lens to the blob (seed), saved as a.
-    ximgsize = 1920-cropleft
-    yimgsize = 1080-croptop
+    yimgsize = frameSize[1]-croptop
     X = abs(centerpoint[0]-xIntersect)
     Y = abs(yimgsize-centerpoint[1])
-    y_x = Y*1.0/X
-    phi = math.atan(y_x)
+    phi = math.atan2(Y,X) # atan(Y/X), also for X == 0
     a = math.sqrt((X)**2+(Y)**2) # pixels
     b_sqrd = (a)**2 + (distCamera_y_component)**2 - (2*a*distCamera_y_component*(math.cos(abs(phi)+(math.pi)/2)))
     b = math.sqrt(b_sqrd) # side b of triangle pixels
@@ -8,7 +8,7 @@ world units (typically centimeters or centimeters cubed). Also note
 that the pre-processing must be completed before using this script.
 The directory structure and steps for inputting calibration data can
 be found in the user guides on Google Drive. Developed and tested with
-Python 2.7.x and OpenCV 2.4.x.
+Python 2.7.x and OpenCV 2.4.x as well as Python 3.x and OpenCV 4.x.
 
 Written by Kevin Kreher (kmk279@cornell.edu).
 """
@@ -16,339 +16,699 @@ Written by Kevin Kreher (kmk279@cornell.edu).
 __author__ = 'Kevin Kreher'
 
 from salib import *
+from saimage import load_image
 import saconfig as sacfg
 import numpy as np
 import cv2
 import math
-import csv
-import string
+import json
 import os.path
+import sys
 import operator
+import multiprocessing
+import sacli
+import sacache
+import saprofile
+import sadebug
+import sasink
 
-# These variables are responsible for converting from pixel length
-#    measurements made by the script to real world distances. They are
-#    all defined and described in saconfig.py, and the associated
-#	 Google Drive documentation.
-top_ScaleFactor = sacfg.topScaleFactor
-top_CameraDist_in = sacfg.topCameraDistin
-top_CameraDist_angle = sacfg.topCameraDistangle
-side_ScaleFactor_eqM = sacfg.sideScaleFactoreqM
-side_ScaleFactor_eqB = sacfg.sideScaleFactoreqB
-side_ScaleFactor_intersectX = sacfg.sideScaleFactorintersectX
-top_cropleft = sacfg.topCropleft
-top_croptop = sacfg.topCroptop
-
-# DebugMode shows the image at each step, not recommended when
-#    many images need to be processed.
-debugMode = sacfg.debugmode
-workingDir = raw_input('Directory name (ex. test12801/SeedImages)?: ')
-csvfile = open(workingDir + '_processed.csv', 'wb') # CSV file for data.
 fieldnames = ['number','file path','length (cm)','width (cm)','height (cm)',
               'color value (R)','color value (G)','color value (B)',
-			  'volume (cm3)','angle (degrees)','error','height_ratiomethod (cm)',
-			  'count1','r1','g1','b1','count2','r2','g2','b2','count3','r3',
-			  'g3','b3','count4','r4','g4','b4','count5','r5','g5','b5']
-writerObj = csv.DictWriter(csvfile, fieldnames=fieldnames)
-writerObj.writeheader()
-print('Processing directory: ' + workingDir)
-x = 0 # Tracks with image number.
-for top_fileName in glob.glob(workingDir + '/TopImage*'):
-	# Find the side image filename.
-	side_fileName = string.replace(top_fileName,'TopImage','SideImage')
-	if os.path.isfile(side_fileName) == False:
-		# A lazy programmer made this step necessary.
-		side_fileName = string.replace(side_fileName,'SideImage','Side')
-	# Import top and side images.
-	top_imageColor = cv2.imread(top_fileName,1) # B,G,R color channels
-	top_imageBW = cv2.imread(top_fileName,0) # BW
-	side_imageColor = cv2.imread(side_fileName,1) # B,G,R color channels
-	side_imageBW = cv2.imread(side_fileName,0) # BW
+              'volume (cm3)','angle (degrees)','error','height_ratiomethod (cm)',
+              'count1','r1','g1','b1','count2','r2','g2','b2','count3','r3',
+              'g3','b3','count4','r4','g4','b4','count5','r5','g5','b5']
+# Types of the columns in the columnar output, other columns are floats.
+columnTypes = dict([('number',int), ('file path',str), ('error',str),
+                    ('color value (R)',int), ('color value (G)',int),
+                    ('color value (B)',int), ('seed index',int)] +
+                   [(name + str(i),int) for i in range(1,6)
+                    for name in ('count','r','g','b')])
+
+# Stages written to the CSV by --timings, blocks of analyzeSeedPair()
+#    and the salib functions timed with saprofile.timed().
+timingStages = ['decode','seeds','top','top rotate','side','color',
+                'findAllSeedBounds','findMaxSizeBounds','rotateImage',
+                'findVolume','colorStats','total']
+
+_sideScaleCalibrations = {}
+
+def sideScaleCalibration():
+    """ Returns the SideScaleCalibration (see salib.py) of the current
+    saconfig values. It is built on first use and kept, so each process
+    builds it once per run.
+    """
+    args = ((sacfg.frameWidth,sacfg.frameHeight),sacfg.topCropleft,
+            sacfg.topCroptop,sacfg.topScaleFactor,sacfg.sideScaleFactoreqM,
+            sacfg.sideScaleFactoreqB,sacfg.sideScaleFactorintersectX,
+            sacfg.topCameraDistin,sacfg.topCameraDistangle,
+            sacfg.sideScaleGridStep)
+    calibration = _sideScaleCalibrations.get(args)
+    if calibration is None:
+        _sideScaleCalibrations.clear() # Only the current one is needed.
+        calibration = SideScaleCalibration(*args)
+        _sideScaleCalibrations[args] = calibration
+    return calibration
+
+def findTopFileNames(workingDir):
+    """ Returns the top images (TopImage*) of a directory sorted by
+    name, the order they are numbered in.
+    """
+    return sorted(glob.glob(workingDir + '/TopImage*'))
+
+def findSideFileName(top_fileName):
+    """ Returns the side image filename belonging to a top image.
+
+    top_fileName - path of the top image (TopImage*)
+    """
+    side_fileName = top_fileName.replace('TopImage','SideImage')
+    if os.path.isfile(side_fileName) == False:
+        # A lazy programmer made this step necessary.
+        side_fileName = side_fileName.replace('SideImage','Side')
+    return side_fileName
+
+def analyzeSeedPair(top_fileName,side_fileName):
+    """ Returns the result row (without 'number') for one top/side pair.
+
+    Loads both images (see loadSeedPair()) and measures the largest
+    seed with analyzeSeedImages().
+
+    top_fileName - path of the top image
+    side_fileName - path of the matching side image
+    """
+    return analyzeSeedImages(top_fileName,
+                             *loadSeedPair(top_fileName,side_fileName))
+
+def analyzeSeeds(top_fileName,side_fileName):
+    """ Returns one result row (without 'number') for every seed of a
+    top/side pair (see analyzeSeedsImages()).
+
+    top_fileName - path of the top image
+    side_fileName - path of the matching side image
+    """
+    return analyzeSeedsImages(top_fileName,
+                              *loadSeedPair(top_fileName,side_fileName))
+
+def analyzeSeedsImages(top_fileName,top_imageColor,top_imageBW,
+                       side_imageColor,side_imageBW):
+    """ Returns one result row (without 'number') for every seed of a
+    top/side pair of decoded images, with the position of the seed from
+    left to right in 'seed index'.
+
+    All objects within the area bounds of saconfig are seeds (see
+    findAllSeedBounds()), top and side seeds are paired by their
+    position along the x-axis (see matchSeeds()). Each pair is measured
+    with analyzeSeedImages() on images in which the other seeds are
+    blacked out, so every seed gets the same measurements and error
+    checks as a seed imaged alone. Top seeds without a side seed get a
+    row with only an error. If no seed is found there is one row with
+    an empty 'seed index'.
+
+    top_fileName - path of the top image, written to 'file path'
+    top_imageColor - top image (B,G,R)
+    top_imageBW - top image (grayscale)
+    side_imageColor - side image (B,G,R), only used for debug images
+    side_imageBW - side image (grayscale)
+    """
+    with saprofile.stage('seeds'):
+        top_Seeds = findAllSeedBounds(top_imageBW,sacfg.topthreshValue,
+                                      sacfg.topAreaminerror,
+                                      sacfg.topAreamaxerror)
+        side_Seeds = findAllSeedBounds(side_imageBW,sacfg.sidethreshVal,
+                                       sacfg.sideAreaminerror,
+                                       sacfg.sideAreamaxerror)
+        matches = matchSeeds(top_Seeds['centers'],top_imageBW.shape[1],
+                             side_Seeds['centers'],side_imageBW.shape[1])
+    if len(matches) == 0:
+        return [{'file path':top_fileName, 'error':'no_seeds_found-'}]
+    # The top seeds are measured first, so the side scale factors of
+    #    all of them are looked up at once.
+    top_imageSeeds = {}
+    top_Measurements = {}
+    for seedIndex, sideMatch in enumerate(matches):
+        if sideMatch is not None:
+            top_imageSeeds[seedIndex] = isolateSeed(
+                top_imageBW,top_Seeds['contourList'],
+                top_Seeds['seedIndices'][seedIndex])
+            top_Measurements[seedIndex] = measureTopSeed(
+                top_imageSeeds[seedIndex])
+    measured = sorted(top_Measurements)
+    side_ScaleFactors = {}
+    if measured:
+        factors = sideScaleCalibration().scaleFactors(
+            [top_Measurements[i][0]['center'] for i in measured],
+            [top_Measurements[i][0]['angle'] for i in measured],
+            [top_Measurements[i][2]['length'] for i in measured])
+        side_ScaleFactors = dict(zip(measured,[float(factor)
+                                               for factor in factors]))
+    rows = []
+    for seedIndex, sideMatch in enumerate(matches):
+        if sideMatch is None:
+            row = {'file path':top_fileName,
+                   'error':'side_seed_not_found-'}
+        else:
+            side_imageSeed = isolateSeed(side_imageBW,
+                                         side_Seeds['contourList'],
+                                         side_Seeds['seedIndices'][sideMatch])
+            row = analyzeSeedImages(top_fileName,top_imageColor,
+                                    top_imageSeeds[seedIndex],
+                                    side_imageColor,side_imageSeed,seedIndex,
+                                    top_Measurements[seedIndex],
+                                    side_ScaleFactors[seedIndex])
+        row['seed index'] = seedIndex
+        rows.append(row)
+    return rows
+
+def loadSeedPair(top_fileName,side_fileName):
+    """ Returns (top color, top BW, side color, side BW) of a pair.
+
+    With cropOnLoad the uncropped images are cropped as they are
+    loaded, with lowMemory the side color image is only kept for
+    debug images (see saconfig.py).
+
+    top_fileName - path of the top image
+    side_fileName - path of the matching side image
+    """
+    topBox = None
+    sideBox = None
+    if sacfg.cropOnLoad:
+        # Same regions as preproclib.top_crop_stage and side_crop_stage.
+        topBox = (sacfg.topCropleft,sacfg.topCroptop,None,None)
+        sideBox = (sacfg.sideCropxpos,sacfg.sideCropypos,
+                   sacfg.sideCropwidth,sacfg.sideCropheight)
+    keepSideColor = (not sacfg.lowMemory or
+                     (sacfg.debugmode and sadebug.sampled(top_fileName)))
+    # Import top and side images.
+    # Each file is decoded once, BW is derived from the B,G,R image.
+    with saprofile.stage('decode'):
+        top_imageColor, top_imageBW = load_image(top_fileName,topBox)
+        side_imageColor, side_imageBW = load_image(side_fileName,sideBox)
+        if not keepSideColor:
+            side_imageColor = None
+        if sacfg.cropOnLoad:
+            # The crop step also turns the side image by 90 degrees.
+            side_imageBW = np.ascontiguousarray(np.rot90(side_imageBW))
+            if side_imageColor is not None:
+                side_imageColor = np.ascontiguousarray(
+                    np.rot90(side_imageColor))
+    return top_imageColor, top_imageBW, side_imageColor, side_imageBW
+
+def measureTopSeed(top_imageBW):
+    """ Returns (measurements, rotated image, rotated measurements) of
+    the largest seed in a top image, the measurements as returned by
+    findLengthWidth().
+
+    If the seed is greatly angled the image is rotated such that the
+    length of the seed is parallel to the x-axis and the seed is
+    measured again. Only a padded region around the seed is rotated
+    and searched, positions in it are relative to the region. If it is
+    not rotated, the rotated image and measurements are the unrotated
+    ones.
+
+    top_imageBW - top image (grayscale)
+    """
+    top_threshValue = sacfg.topthreshValue
+    useComponents = sacfg.useConnectedComponents
+    with saprofile.stage('top'):
+        top_Variables_noRotate = findLengthWidth(top_imageBW,top_threshValue,
+                                                 useComponents)
+    with saprofile.stage('top rotate'):
+        top_Angle_noRotate = top_Variables_noRotate['angle']
+        if abs(top_Angle_noRotate) > 5:
+            top_Roi = seedRoi(top_Variables_noRotate['contours'][
+                                  top_Variables_noRotate['largestIndex']],
+                              top_Variables_noRotate['center'],
+                              top_imageBW.shape,sacfg.roiPadding)
+            top_imageBW_rotated = rotateImage(top_imageBW,top_Angle_noRotate,
+                                              top_Variables_noRotate['center'],
+                                              top_Roi)
+            top_Variables_rotated = findLengthWidth(top_imageBW_rotated,
+                                                    top_threshValue,
+                                                    useComponents)
+        else:
+            top_imageBW_rotated = top_imageBW
+            top_Variables_rotated = top_Variables_noRotate
+    return top_Variables_noRotate, top_imageBW_rotated, top_Variables_rotated
+
+def analyzeSeedImages(top_fileName,top_imageColor,top_imageBW,
+                      side_imageColor,side_imageBW,seedIndex=None,
+                      topMeasurements=None,side_ScaleFactor=None):
+    """ Returns the result row (without 'number') for one top/side pair
+    of decoded images.
+
+    The values are typed (floats for the measurements, ints for the
+    colors), the CSV writer formats them with str().
+
+    All the per-seed work (length/width, rotation, side scale factor,
+    volume and color) happens here. The function only depends on its
+    arguments and saconfig so it can run in a worker process. The
+    images are not changed.
+
+    top_fileName - path of the top image, written to 'file path'
+    top_imageColor - top image (B,G,R)
+    top_imageBW - top image (grayscale)
+    side_imageColor - side image (B,G,R), only used for debug images
+    side_imageBW - side image (grayscale)
+    seedIndex - index of the seed in analyzeSeeds(), names its debug
+                image
+    topMeasurements - measureTopSeed() of top_imageBW if it was
+                      already measured, otherwise None
+    side_ScaleFactor - side scale factor of the seed if it was already
+                       looked up, otherwise None
+    """
+    # These variables are responsible for converting from pixel length
+    #    measurements made by the script to real world distances. They
+    #    are all defined and described in saconfig.py, and the
+    #    associated Google Drive documentation. They are read for every
+    #    pair so that command line overrides of saconfig are honored.
+    top_ScaleFactor = sacfg.topScaleFactor
+    top_CameraDist_angle = sacfg.topCameraDistangle
+    # DebugMode saves images of each step (see sadebug.py), not
+    #    recommended when many images need to be processed.
+    debugMode = sacfg.debugmode
+    useComponents = sacfg.useConnectedComponents
+
     # Pre-processing now crops, this was left in case this changes.
-	top_imageBW_crop = top_imageBW
-	top_imageColor_crop = top_imageColor
-	side_imageBW_crop = side_imageBW
-	side_imageColor_crop = side_imageColor
-
-	if debugMode:
-		cv2.imshow(str(top_fileName),top_imageColor_crop)
-		cv2.waitKey(0)
-		cv2.destroyWindow(str(top_fileName))
-		cv2.imshow(str(side_fileName),side_imageColor_crop)
-		cv2.waitKey(0)
-		cv2.destroyWindow(str(side_fileName))
-
-	# Calculate the length, width, etc. of the top image seed.
-	top_threshValue = sacfg.topthreshValue
-	top_Variables_noRotate = findLengthWidth(top_imageBW_crop,top_threshValue)
-	top_Length_noRotate = top_Variables_noRotate['length']
-	top_Width_noRotate = top_Variables_noRotate['width']
-	top_Angle_noRotate = top_Variables_noRotate['angle']
-	top_centerPoint_noRotate = top_Variables_noRotate['center']
-	topX = top_centerPoint_noRotate[0]
-	topY = top_centerPoint_noRotate[1]
-	top_Area_noRotate = top_Variables_noRotate['area']
-	top_largestIndex_noRotate = top_Variables_noRotate['largestIndex'] 
-	top_Contours_noRotate = top_Variables_noRotate['contours']
-
-	# If the seed is greatly angled the next step rotates the seed
-	#    such that its length is parallel to the x-axis and re-
-	#    calculates the variables found above (length, width, etc.).
-	if abs(top_Angle_noRotate) > 5:
-		top_imageBW_crop_rotated = rotateImage(top_imageBW_crop,
-			                                   top_Angle_noRotate,
-			                                   top_centerPoint_noRotate)
-	else:
-		top_imageBW_crop_rotated = top_imageBW_crop
-    
-	top_Variables_rotated = findLengthWidth(top_imageBW_crop_rotated,
-		                                    top_threshValue)
-	top_Length_rotated = top_Variables_rotated['length']
-	top_Width_rotated = top_Variables_rotated['width']
-	top_Angle_rotated = top_Variables_rotated['angle']
-	top_centerPoint_rotated = top_Variables_rotated['center']
-	top_Area_rotated = top_Variables_rotated['area']
-	top_largestIndex_rotated = top_Variables_rotated['largestIndex'] 
-	top_Contours_rotated = top_Variables_rotated['contours']
-
-	if debugMode:
-		unused, top_debugThresh = cv2.threshold(top_imageBW_crop_rotated,
-			                                    top_threshValue,255,
-			                                    cv2.THRESH_BINARY)
-		top_debugThresh = erodeAndDilate(top_debugThresh,np.ones((5,5),
-			                             np.uint8),1)
-		cv2.imshow(str(top_fileName),top_debugThresh)
-		cv2.waitKey(0)
-		cv2.destroyWindow(str(top_fileName))
-		debugContourTop = top_imageColor_crop
-		cv2.drawContours(debugContourTop,top_Contours_noRotate,
-			             top_largestIndex_noRotate,(0,0,255),1)
-		cv2.imshow(str(top_fileName),debugContourTop)
-		cv2.waitKey(0)
-		cv2.destroyWindow(str(top_fileName))
-
-	# Calculate the length, width, etc. of the side image seed.
-	side_threshVal = sacfg.sidethreshVal
-	side_Variables = findLengthWidth(side_imageBW_crop,side_threshVal)
-	side_Length = side_Variables['length']
-	side_Width = side_Variables['width']
-	side_Angle = side_Variables['angle']
-	side_centerPoint = side_Variables['center']
-	side_Area = side_Variables['area']
-	side_largestIndex = side_Variables['largestIndex'] 
-	side_Contours = side_Variables['contours']
-	side_ScaleFactor = calcSideScaleFactor(top_centerPoint_noRotate,
-										  top_cropleft,top_croptop,
-		                                  top_ScaleFactor,
-		                                  side_ScaleFactor_eqM,
-		                                  side_ScaleFactor_eqB,
-		                                  side_ScaleFactor_intersectX,
-		                                  top_CameraDist_in,
-		                                  top_CameraDist_angle,
-		                                  top_Angle_noRotate,
-		                                  top_Length_rotated)
-
-	if debugMode:
-		unused, debugThreshSide = cv2.threshold(side_imageBW_crop,
-			                                    side_threshVal,255,
-			                                    cv2.THRESH_BINARY)
-		debugThreshSide = erodeAndDilate(debugThreshSide,np.ones((5,5),
-			                             np.uint8),1)
-		cv2.imshow(str(top_fileName),debugThreshSide)
-		cv2.waitKey(0)
-		cv2.destroyWindow(str(top_fileName))
-		debugContourSide = side_imageColor_crop
-		# Create rectangle containing seed and find midpoints.
-		bounds = cv2.minAreaRect(side_Contours[side_largestIndex])
-		box = cv2.cv.BoxPoints(bounds)
-		box = np.int0(box)
-		cv2.drawContours(debugContourSide,[box],0,(0,0,255),1)
-		cv2.drawContours(debugContourSide,side_Contours,side_largestIndex,
-			             (0,0,255),1)
-		cv2.imshow(str(top_fileName),debugContourSide)
-		cv2.waitKey(0)
-		cv2.destroyWindow(str(top_fileName))
-
-	# Code for detecting any processing errors.
-	top_Area_max_error = sacfg.topAreamaxerror
-	top_Area_min_error = sacfg.topAreaminerror
-	top_Angle_max_error = sacfg.topAnglemaxerror
-	side_Area_max_error = sacfg.sideAreamaxerror
-	side_Area_min_error = sacfg.sideAreaminerror
-	# No seeds (oat), when properly detected were larger/smaller
-	# than these numbers in tests. Applies to top/side.
-	error = ''
-	if contourHitsEdge(top_largestIndex_noRotate,top_Contours_noRotate,
-		               top_imageBW_crop):
-		error += 'top_contour_conflicts_edge-'
-	if top_Area_noRotate >= top_Area_max_error:
-		error += 'top_area_too_large-'
-	if top_Area_noRotate <= top_Area_min_error:
-		error += 'top_area_too_small-'
-	if abs(top_Angle_noRotate) > top_Angle_max_error:
-		error += 'angle_over_max_error-'
-	if side_Area >= side_Area_max_error:
-		error += 'side_area_too_large-'
-	if side_Area <= side_Area_min_error:
-		error += 'side_area_too_small-'
-
-	# Volume calculation occurs below if no errors are detected.
-	if len(error) < 1:
-		if abs(side_Angle) > 6:
-			# Rotate the side image so the axis of its length is
-			#    parallel to the x-axis. Not always necessary.
-			side_imageRotated_forVol = rotateImage(side_imageBW_crop,
-				                                   side_Angle,
-				                                   side_centerPoint)
-			side_Variables_forVol = findLengthWidth(side_imageRotated_forVol,
-				                                    side_threshVal)
-		else:
-			side_imageRotated_forVol = side_imageBW_crop
-			side_Variables_forVol = side_Variables
-		volume = findVolume(top_imageBW_crop_rotated,side_imageRotated_forVol,
-			                top_Variables_rotated,side_Variables_forVol,
-			                side_threshVal,top_ScaleFactor,side_ScaleFactor)
-	else:
-		volume = 0
-
-	# Find average color value. Numpy values are saved as B,G,R.
-	#    Only accurate if pre-processed correctly. The next steps
-	#    Create a mask over the colored pixels before a list is made
-	#    that can be used to start manipulating the color values.
-	cimg = np.zeros_like(top_imageBW_crop)
-	cv2.drawContours(cimg,top_Contours_noRotate,top_largestIndex_noRotate,
-		             255,-1)
-	pts = np.where(cimg == 255) # List of all seed colored pixels.
-	i = 0
-	lst_intensities = []
-	while i < len(pts[0]):
-		lst_intensities.append(top_imageColor_crop[pts[0][i], pts[1][i]])
-		i += 1
-	color_dict = {} # Dictionary for keeping count of color occurences.
-	blue = 0
-	green = 0
-	red = 0
-	i = 0
-	pixelcount = 0
-	while i < len(lst_intensities):
-		b_temp = lst_intensities[i][0]
-		g_temp = lst_intensities[i][1]
-		r_temp = lst_intensities[i][2]
-		# A filter could be used here.
-		blue += b_temp
-		green += g_temp
-		red += r_temp
-		pixelcount += 1 # Number of pixels analyzed (if filter used)
-		rgb_key = (r_temp,g_temp,b_temp) # Key for dictionary.
-		if rgb_key in color_dict:
-			color_dict[rgb_key] += 1
-		else:
-			color_dict[rgb_key] = 1
-		i += 1
-	# An additional csv file is created to store RGB color information.
-	# NO LONGER USED - REMOVED FROM OUTPUT
-	#slash_index = workingDir.rfind('/')
-	#if slash_index == -1:
-	#	slash_index = workingDir.rfind('\\') # Running on windows.
-	#color_dir_name = workingDir[:slash_index+1]
-	#color_file_number = str(x).zfill(3) # Pad with zeroes.
-	#csvfile_colors = open(color_dir_name + 'TopImage_' + color_file_number
-	#	                  + '_rgb.csv', 'wb') # CSV file for data.
-	#fieldnames_colors = ['r','g','b','count']
-	#writerObj2 = csv.DictWriter(csvfile_colors, fieldnames=fieldnames_colors)
-	#writerObj2.writeheader()
-	#writerObj2.writerow({'r':'','g':'','b':'total count:',
-	#                     'count':str(pixelcount)}) # Prints pixel total.
-	#for key, value in color_dict.items():
-	#	if value > 2:
-	#		writerObj2.writerow({'r':str(key[0]),'g':str(key[1]),
-	#			                 'b':str(key[2]),'count':str(value)})
-	#csvfile_colors.close()
-	if pixelcount > 0:
-		blueAverage = blue/pixelcount
-		greenAverage = green/pixelcount
-		redAverage = red/pixelcount
-	else:
-		blueAverage = 0
-		greenAverage = 0
-		redAverage = 0
-
-	# Final scaling step
-	lengthcm = top_Length_noRotate*top_ScaleFactor
-	widthcm = top_Width_noRotate*top_ScaleFactor
-	heightcm = side_Width*side_ScaleFactor
-	# New height method based on ratio of side pixel length vs.
-	# top pixel length.
-	# NO LONGER USED - REMOVED FROM OUTPUT
-	angle_cor = (90-top_CameraDist_angle)-top_Angle_noRotate
-	angle_cor_rad = math.radians(angle_cor)
-	if angle_cor != 90 and side_Length != 0:
-		side_length_cor = side_Length/math.cos(angle_cor_rad)
-		side_ScaleFactor_ratiomethod = lengthcm/side_length_cor
-		heightcm_ratiomethod = side_Width*side_ScaleFactor_ratiomethod
-	else:
-		heightcm_ratiomethod = 0
-
-	if debugMode:
-		debugImage = top_imageColor_crop
-		cv2.drawContours(debugImage,top_Contours_noRotate,
-			             top_largestIndex_noRotate,(0,0,255),1)
-		bounds = cv2.minAreaRect(
-			   top_Contours_noRotate[top_largestIndex_noRotate])
-		box = cv2.cv.BoxPoints(bounds) # Box around seed
-		box = np.int0(box)
-		cv2.drawContours(debugImage,[box],0,(0,0,255),1)
-		cv2.circle(debugImage,top_centerPoint_noRotate,2,(0,255,0),-1)
-		cv2.putText(debugImage,'ctr',top_centerPoint_noRotate,
-			        cv2.FONT_HERSHEY_SIMPLEX,.5,(0,255,0))
-		lengthText = 'length (cm) = ' + str(lengthcm)
-		widthText = 'width (cm) = ' + str(widthcm)
-		areaText = 'area (pixels) = ' + str(top_Area_noRotate)
-		colorValueText = 'color value (R G B) = (' + str(redAverage) + "," + str(greenAverage) + "," + str(blueAverage) + ")"
-		heightText = 'height (cm) = ' + str(heightcm)
-		volumeText = 'volume (cm3) = ' + str(volume)
-		angleText = 'angle (degrees) = ' + str(top_Angle_noRotate)
-		errorText = 'error = ' + error
-		topxText = 'topXpos (pixel) = ' + str(topX)
-		topyText = 'topYpos (pixel) = ' + str(topY)
-		cv2.putText(debugImage,top_fileName,(10,20),
-			        cv2.FONT_HERSHEY_SIMPLEX,.5,(0,0,255))
-		cv2.putText(debugImage,lengthText,(10,40),
-			        cv2.FONT_HERSHEY_SIMPLEX,.5,(0,0,255))
-		cv2.putText(debugImage,widthText,(10,60),
-			        cv2.FONT_HERSHEY_SIMPLEX,.5,(0,0,255))
-		cv2.putText(debugImage,areaText,(10,80),
-			        cv2.FONT_HERSHEY_SIMPLEX,.5,(0,0,255))
-		cv2.putText(debugImage,colorValueText,(10,100),
-			        cv2.FONT_HERSHEY_SIMPLEX,.5,(0,0,255))
-		cv2.putText(debugImage,heightText,(10,120),
-			        cv2.FONT_HERSHEY_SIMPLEX,.5,(0,0,255))
-		cv2.putText(debugImage,volumeText,(10,140),
-			        cv2.FONT_HERSHEY_SIMPLEX,.5,(0,0,255))
-		cv2.putText(debugImage,angleText,(10,160),
-			        cv2.FONT_HERSHEY_SIMPLEX,.5,(0,0,255))
-		cv2.putText(debugImage,errorText,(10,180),
-			        cv2.FONT_HERSHEY_SIMPLEX,.5,(0,0,255))
-		cv2.putText(debugImage,topxText,(10,200),
-			        cv2.FONT_HERSHEY_SIMPLEX,.5,(0,0,255))
-		cv2.putText(debugImage,topyText,(10,220),
-			        cv2.FONT_HERSHEY_SIMPLEX,.5,(0,0,255))
-		cv2.imshow(str(top_fileName) + ' final output',debugImage)
-		cv2.waitKey(0)
-		cv2.destroyWindow(str(top_fileName) + ' final output')
-
-	writerObj.writerow({'number':str(x),
-		                'file path':top_fileName,
-						'length (cm)':str(lengthcm),
-						'width (cm)':str(widthcm),
-						'height (cm)':str(heightcm),
-						'color value (R)':str(redAverage),
-						'color value (G)':str(greenAverage),
-						'color value (B)':str(blueAverage),
-						'volume (cm3)':str(volume),
-						'angle (degrees)':str(top_Angle_noRotate),
-						'error':error})
-	print('processed: ' + top_fileName + '  [' + str(x) + ']')
-	x += 1
-csvfile.close()
-print('Done: data saved in ' + color_dir_name)
-exit()
\ No newline at end of file
+    top_imageBW_crop = top_imageBW
+    top_imageColor_crop = top_imageColor
+    side_imageBW_crop = side_imageBW
+    side_imageColor_crop = side_imageColor
+
+    # Calculate the length, width, etc. of the top image seed, and
+    #    again after rotating a greatly angled seed such that its
+    #    length is parallel to the x-axis (see measureTopSeed()).
+    top_threshValue = sacfg.topthreshValue
+    if topMeasurements is None:
+        topMeasurements = measureTopSeed(top_imageBW_crop)
+    (top_Variables_noRotate, top_imageBW_crop_rotated,
+     top_Variables_rotated) = topMeasurements
+    top_Length_noRotate = top_Variables_noRotate['length']
+    top_Width_noRotate = top_Variables_noRotate['width']
+    top_Angle_noRotate = top_Variables_noRotate['angle']
+    top_centerPoint_noRotate = top_Variables_noRotate['center']
+    topX = top_centerPoint_noRotate[0]
+    topY = top_centerPoint_noRotate[1]
+    top_Area_noRotate = top_Variables_noRotate['area']
+    top_largestIndex_noRotate = top_Variables_noRotate['largestIndex'] 
+    top_Contours_noRotate = top_Variables_noRotate['contours']
+
+    top_Length_rotated = top_Variables_rotated['length']
+    top_Width_rotated = top_Variables_rotated['width']
+    top_Angle_rotated = top_Variables_rotated['angle']
+    top_centerPoint_rotated = top_Variables_rotated['center']
+    top_Area_rotated = top_Variables_rotated['area']
+    top_largestIndex_rotated = top_Variables_rotated['largestIndex'] 
+    top_Contours_rotated = top_Variables_rotated['contours']
+
+    # Calculate the length, width, etc. of the side image seed.
+    side_threshVal = sacfg.sidethreshVal
+    with saprofile.stage('side'):
+        side_Variables = findLengthWidth(side_imageBW_crop,side_threshVal,
+                                         useComponents)
+    side_Length = side_Variables['length']
+    side_Width = side_Variables['width']
+    side_Angle = side_Variables['angle']
+    side_centerPoint = side_Variables['center']
+    side_Area = side_Variables['area']
+    side_largestIndex = side_Variables['largestIndex'] 
+    side_Contours = side_Variables['contours']
+    if side_ScaleFactor is None:
+        side_ScaleFactor = sideScaleCalibration().scaleFactor(
+            top_centerPoint_noRotate,top_Angle_noRotate,top_Length_rotated)
+
+    # Code for detecting any processing errors.
+    top_Area_max_error = sacfg.topAreamaxerror
+    top_Area_min_error = sacfg.topAreaminerror
+    top_Angle_max_error = sacfg.topAnglemaxerror
+    side_Area_max_error = sacfg.sideAreamaxerror
+    side_Area_min_error = sacfg.sideAreaminerror
+    # No seeds (oat), when properly detected were larger/smaller
+    # than these numbers in tests. Applies to top/side.
+    error = ''
+    if contourHitsEdge(top_largestIndex_noRotate,top_Contours_noRotate,
+                       top_imageBW_crop):
+        error += 'top_contour_conflicts_edge-'
+    if top_Area_noRotate >= top_Area_max_error:
+        error += 'top_area_too_large-'
+    if top_Area_noRotate <= top_Area_min_error:
+        error += 'top_area_too_small-'
+    if abs(top_Angle_noRotate) > top_Angle_max_error:
+        error += 'angle_over_max_error-'
+    if side_Area >= side_Area_max_error:
+        error += 'side_area_too_large-'
+    if side_Area <= side_Area_min_error:
+        error += 'side_area_too_small-'
+
+    # Volume calculation occurs below if no errors are detected.
+    if len(error) < 1:
+        if abs(side_Angle) > 6:
+            # Rotate the side image so the axis of its length is
+            #    parallel to the x-axis. Not always necessary. Only
+            #    the region around the seed is rotated.
+            side_Roi = seedRoi(side_Contours[side_largestIndex],
+                               side_centerPoint,side_imageBW_crop.shape,
+                               sacfg.roiPadding)
+            side_imageRotated_forVol = rotateImage(side_imageBW_crop,
+                                                   side_Angle,
+                                                   side_centerPoint,
+                                                   side_Roi)
+            side_Variables_forVol = findLengthWidth(side_imageRotated_forVol,
+                                                    side_threshVal,
+                                                    useComponents)
+        else:
+            side_imageRotated_forVol = side_imageBW_crop
+            side_Variables_forVol = side_Variables
+        volume = findVolume(top_imageBW_crop_rotated,side_imageRotated_forVol,
+                            top_Variables_rotated,side_Variables_forVol,
+                            side_threshVal,top_ScaleFactor,side_ScaleFactor)
+    else:
+        volume = 0
+
+    # Find average color value and the most common colors. Numpy
+    #    values are saved as B,G,R. Only accurate if pre-processed
+    #    correctly. A mask over the colored pixels selects the seed,
+    #    it only covers the bounding rectangle of the seed.
+    with saprofile.stage('color'):
+        top_Contour = top_Contours_noRotate[top_largestIndex_noRotate]
+        x,y,w,h = cv2.boundingRect(top_Contour)
+        color_Stats = colorStats(top_imageColor_crop[y:y+h,x:x+w],
+                                 contourMask(top_Contour),
+                                 sacfg.colorClusters,sacfg.colorBinSize)
+    blueAverage = color_Stats['blue']
+    greenAverage = color_Stats['green']
+    redAverage = color_Stats['red']
+
+    # Final scaling step
+    lengthcm = top_Length_noRotate*top_ScaleFactor
+    widthcm = top_Width_noRotate*top_ScaleFactor
+    heightcm = side_Width*side_ScaleFactor
+    # New height method based on ratio of side pixel length vs.
+    # top pixel length.
+    # NO LONGER USED - REMOVED FROM OUTPUT
+    angle_cor = (90-top_CameraDist_angle)-top_Angle_noRotate
+    angle_cor_rad = math.radians(angle_cor)
+    if angle_cor != 90 and side_Length != 0:
+        side_length_cor = side_Length/math.cos(angle_cor_rad)
+        side_ScaleFactor_ratiomethod = lengthcm/side_length_cor
+        heightcm_ratiomethod = side_Width*side_ScaleFactor_ratiomethod
+    else:
+        heightcm_ratiomethod = 0
+
+    # Debug images are drawn on copies and written by a background
+    #    thread (see sadebug.py), only for a sample of the images.
+    if debugMode and sadebug.sampled(top_fileName):
+        text = [top_fileName,
+                'length (cm) = ' + str(lengthcm),
+                'width (cm) = ' + str(widthcm),
+                'area (pixels) = ' + str(top_Area_noRotate),
+                'color value (R G B) = (' + str(redAverage) + ',' +
+                str(greenAverage) + ',' + str(blueAverage) + ')',
+                'height (cm) = ' + str(heightcm),
+                'volume (cm3) = ' + str(volume),
+                'angle (degrees) = ' + str(top_Angle_noRotate),
+                'error = ' + error,
+                'topXpos (pixel) = ' + str(topX),
+                'topYpos (pixel) = ' + str(topY)]
+        debugInfo = {'topColor':top_imageColor_crop,
+                     'topContour':
+                         top_Contours_noRotate[top_largestIndex_noRotate],
+                     'topCenter':top_centerPoint_noRotate,
+                     'topRotated':top_imageBW_crop_rotated,
+                     'topThresh':top_threshValue,
+                     'sideColor':side_imageColor_crop,
+                     'sideContour':side_Contours[side_largestIndex],
+                     'sideBW':side_imageBW_crop,
+                     'sideThresh':side_threshVal,
+                     'text':text}
+        sadebug.get_writer().submit(sadebug.sheet_path(top_fileName,
+                                                       seedIndex),
+                                    sadebug.pair_panels,debugInfo)
+
+    row = {'file path':top_fileName,
+            'length (cm)':lengthcm,
+            'width (cm)':widthcm,
+            'height (cm)':heightcm,
+            'color value (R)':int(redAverage),
+            'color value (G)':int(greenAverage),
+            'color value (B)':int(blueAverage),
+            'volume (cm3)':volume,
+            'angle (degrees)':top_Angle_noRotate,
+            'error':error}
+    # Top colors, count1..count5 stay empty if the seed has fewer colors.
+    for i, (count, r, g, b) in enumerate(color_Stats['clusters'][:5]):
+        n = str(i+1)
+        row['count' + n] = count
+        row['r' + n] = r
+        row['g' + n] = g
+        row['b' + n] = b
+    return row
+
+def processSeedPair(job):
+    """ Pool worker, job is (number, top_fileName, catchErrors, timing).
+
+    Returns (number, top_fileName, rows, times, peakMemory) so results
+    can be written in order as they stream back. rows is a list with
+    the row of the pair, or with multiSeed the rows of all its seeds
+    (see analyzeSeeds()). With catchErrors an exception raised while
+    analyzing the pair is recorded in the error column instead of
+    stopping the run. With timing, times is a
+    dictionary of the seconds spent in each stage and peakMemory the
+    peak resident memory (MB) of the process while analyzing the pair
+    (see saprofile.py), otherwise both are None.
+    """
+    x, top_fileName, catchErrors, timing = job
+    side_fileName = findSideFileName(top_fileName)
+    if sacfg.multiSeed:
+        analyze = analyzeSeeds
+    else:
+        analyze = lambda top, side: [analyzeSeedPair(top,side)]
+    timer = saprofile.StageTimer()
+    if timing:
+        saprofile.reset_peak_memory()
+    try:
+        if timing:
+            with timer:
+                rows = analyze(top_fileName,side_fileName)
+        else:
+            rows = analyze(top_fileName,side_fileName)
+    except Exception as e:
+        if not catchErrors:
+            raise
+        rows = [{'file path':top_fileName,
+                 'error':'exception_' + type(e).__name__ + '-'}]
+    if not timing:
+        return x, top_fileName, rows, None, None
+    return x, top_fileName, rows, timer.times, saprofile.peak_memory_mb()
+
+def pairFailure(rows):
+    """ Returns the error of a pair that could not be analyzed at all
+    (an exception was raised or an image was unreadable), or None.
+
+    rows - processSeedPair() rows of the pair
+    """
+    for row in rows:
+        error = row.get('error','')
+        if error.startswith('exception_') or 'unreadable_image' in error:
+            return error
+    return None
+
+def runSeedPairs(jobs,workers=1,overrides=None):
+    """ Yields processSeedPair() results for jobs, in the same order.
+
+    jobs - list of processSeedPair() jobs
+    workers - number of worker processes, 1 runs in this process
+    overrides - dictionary of saconfig values to apply in the workers
+    """
+    if workers <= 1:
+        for job in jobs:
+            yield processSeedPair(job)
+        return
+    pool = multiprocessing.Pool(workers,sacli.apply_overrides,
+                                (overrides or {},))
+    try:
+        for result in pool.imap(processSeedPair, jobs): # Keeps input order.
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+def timingColumns(times,peakMemory=None):
+    """ Returns the 'time <stage> (ms)' CSV columns of a pair's times
+    and its 'peak memory (MB)' column.
+    """
+    columns = dict(('time ' + name + ' (ms)', round(seconds*1000,3))
+                   for name, seconds in times.items() if name in timingStages)
+    if peakMemory is not None:
+        columns['peak memory (MB)'] = round(peakMemory,1)
+    return columns
+
+def writeRows(csvPath,rows,extraFields=(),columnarPath=None):
+    """ Writes a CSV file with the given rows (see sasink.py), and a
+    columnar file if columnarPath is given.
+    """
+    fields = fieldnames + list(extraFields)
+    sinks = [sasink.CsvSink(csvPath,fields)] # CSV file for data.
+    try:
+        if columnarPath:
+            types = dict((name, columnTypes.get(name,float))
+                         for name in fields)
+            sinks.append(sasink.columnar_sink(columnarPath,fields,types))
+        for row in rows:
+            for sink in sinks:
+                sink.write(row)
+    finally:
+        # Rows written so far are kept if the run stops.
+        for sink in sinks:
+            sink.close()
+
+def analyzeDirectory(workingDir,workers=1,overrides=None,cachePath=None,
+                     timings=False,tracePath=None,columnarPath=None):
+    """ Analyzes every TopImage/SideImage pair in a directory, saves
+    the results to <workingDir>_processed.csv and returns the number
+    of pairs analyzed and the list of (top_fileName, error) of the pairs
+    that failed (see pairFailure()), each failure is also printed as it
+    happens. An exception raised while analyzing a pair is recorded in
+    its error column and the other pairs continue, in every mode.
+
+    In incremental mode (cachePath given) every result is stored in the
+    result cache (see sacache.py) as soon as it is available and pairs
+    that are already in the cache are skipped. The CSV is assembled from
+    the cache once all pairs are done, so a crashed run leaves the last
+    CSV in place and a re-run resumes where it stopped. Pairs that
+    raised an exception are written to the CSV but not cached, so the
+    next run analyzes them again.
+
+    With multiSeed (see saconfig.py) every seed of a pair gets its own
+    row, numbered by its 'seed index' (see analyzeSeeds()).
+
+    With timings or a tracePath the time spent in each stage is
+    measured (see saprofile.py) and a summary table is printed at the
+    end. timings adds the stage times and the peak memory of each pair
+    to the CSV, pairs taken from the cache leave them empty. tracePath writes them to a
+    JSON-lines file, one line per analyzed pair.
+
+    workingDir - directory containing the seed images
+    workers - number of worker processes, 1 runs in this process
+    overrides - dictionary of saconfig values to apply in the workers
+    cachePath - result cache file for incremental mode, or None
+    timings - add 'time <stage> (ms)' and 'peak memory (MB)' columns to
+              the CSV
+    tracePath - JSON-lines file for the stage times, or None
+    columnarPath - .npz or .parquet file with the same columns, typed
+                   (see sasink.py), or None
+    """
+    csvPath = workingDir + '_processed.csv'
+    print('Processing directory: ' + workingDir)
+    timing = timings or tracePath is not None
+    failures = []
+    summary = saprofile.Summary()
+    peakMemories = []
+    traceFile = open(tracePath, 'w') if tracePath else None
+    extraFields = []
+    if sacfg.multiSeed:
+        extraFields = ['seed index']
+    if timings:
+        extraFields += (['time ' + name + ' (ms)' for name in timingStages] +
+                        ['peak memory (MB)'])
+    def recordTimes(x,top_fileName,times,peakMemory):
+        # Returns the timing columns of a pair, if timings are wanted.
+        if times is None:
+            return {}
+        summary.add(times)
+        if peakMemory is not None:
+            peakMemories.append(peakMemory)
+        if traceFile is not None:
+            traceFile.write(json.dumps({'number':x, 'file path':top_fileName,
+                                        'times':times,
+                                        'peak memory (MB)':peakMemory}) + '\n')
+        return timingColumns(times,peakMemory) if timings else {}
+    def recordFailure(top_fileName,rows):
+        # Returns True if the pair failed.
+        error = pairFailure(rows)
+        if error is None:
+            return False
+        sys.stderr.write('Failed: ' + top_fileName + ': ' + error + '\n')
+        failures.append((top_fileName,error))
+        return True
+    # x tracks with image number, it is assigned before the pairs are
+    #    handed out so the numbering does not depend on the workers.
+    top_fileNames = findTopFileNames(workingDir)
+    try:
+        if cachePath is None:
+            jobs = [(x, top_fileName, True, timing)
+                    for x, top_fileName in enumerate(top_fileNames)]
+            def streamRows():
+                for x, top_fileName, rows, times, peakMemory in runSeedPairs(
+                        jobs,workers,overrides):
+                    pairColumns = recordTimes(x,top_fileName,times,peakMemory)
+                    recordFailure(top_fileName,rows)
+                    print('processed: ' + top_fileName + '  [' + str(x) + ']')
+                    for row in rows:
+                        row['number'] = x
+                        row.update(pairColumns)
+                        yield row
+            writeRows(csvPath,streamRows(),extraFields,columnarPath)
+        else:
+            cache = sacache.ResultCache(cachePath)
+            configHash = sacache.config_hash()
+            keys = [sacache.pair_key(top_fileName,
+                                     findSideFileName(top_fileName),configHash)
+                    for top_fileName in top_fileNames]
+            jobs = [(x, top_fileName, True, timing)
+                    for x, top_fileName in enumerate(top_fileNames)
+                    if keys[x] not in cache]
+            print('cached: ' + str(len(top_fileNames)-len(jobs)) + ' of ' +
+                  str(len(top_fileNames)))
+            timeColumns = {}
+            failed = {}
+            try:
+                for x, top_fileName, rows, times, peakMemory in runSeedPairs(
+                        jobs,workers,overrides):
+                    if recordFailure(top_fileName,rows):
+                        # Possibly transient (e.g. MemoryError), retried
+                        #    by the next run.
+                        failed[x] = rows
+                    else:
+                        # The seed rows of a pair are cached together.
+                        cache.put(keys[x],
+                                  rows if sacfg.multiSeed else rows[0])
+                    timeColumns[x] = recordTimes(x,top_fileName,times,
+                                                 peakMemory)
+                    print('processed: ' + top_fileName + '  [' + str(x) + ']')
+            finally:
+                cache.close()
+            rows = []
+            for x, key in enumerate(keys):
+                cached = failed.get(x) or cache.get(key)
+                if not isinstance(cached,list):
+                    cached = [cached]
+                for row in cached:
+                    row = dict(row)
+                    row['number'] = x
+                    row.update(timeColumns.get(x,{}))
+                    rows.append(row)
+            # Replace the CSV only once it is complete.
+            writeRows(csvPath + '.tmp',rows,extraFields,columnarPath)
+            if os.path.exists(csvPath):
+                os.remove(csvPath)
+            os.rename(csvPath + '.tmp',csvPath)
+    finally:
+        if traceFile is not None:
+            traceFile.close()
+        sadebug.close_writer() # Workers flush their own on exit.
+    print('Done: data saved in ' + csvPath)
+    if timing and summary.count:
+        print('Stage timings:')
+        print(summary.table())
+    if peakMemories:
+        # What one worker process needs, size --workers by it.
+        print('Peak memory of a pair: %.1f MB (largest), %.1f MB (median)' %
+              (max(peakMemories),sorted(peakMemories)[len(peakMemories)//2]))
+    return len(top_fileNames), failures
+
+if __name__ == '__main__':
+    # python samain.py DIR [--workers N] [--set name=value] ...
+    #    is the same as python sacli.py analyze DIR ...
+    argv = sys.argv[1:]
+    if argv[:1] != ['analyze']:
+        argv = ['analyze'] + argv
+    sys.exit(sacli.main(argv))
@@ -0,0 +1,162 @@
+""" saprofile.py - Stage timing for the seed analyzer scripts.
+
+A StageTimer collects the time spent in named stages of the analysis
+of one top/side pair. samain.py wraps each block of its per-pair work
+in stage() and the expensive salib functions are decorated with
+timed(). Both only measure while a StageTimer is active (inside a
+'with StageTimer():' block) and cost one lookup otherwise, so the
+instrumentation stays in place for normal runs.
+
+    with StageTimer() as timer:
+        analyzeSeedPair(top, side)
+    timer.times -> {'decode': 0.012, 'volume': 0.003, ...} (seconds)
+
+Summary adds up the timings of many pairs and prints the table shown
+at the end of a run. peak_memory_mb() and reset_peak_memory() measure
+the peak resident memory of a pair, so the memory a worker needs is
+known. Developed and tested with Python 2.7.x and 3.x.
+"""
+
+import threading
+import functools
+import contextlib
+import collections
+import timeit
+import sys
+try:
+    import resource
+except ImportError:
+    resource = None # Not available on Windows, memory is not measured.
+
+_local = threading.local()
+
+class StageTimer(object):
+    """ Collects the seconds spent in named stages.
+
+    Time spent in a stage that is entered again while it is running
+    (or in a stage nested inside another) is counted for both names,
+    so the stages do not have to add up to the total.
+    """
+    def __init__(self):
+        self.times = collections.OrderedDict()
+        self._previous = None
+
+    def add(self, name, seconds):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            self.add(name, timeit.default_timer() - start)
+
+    def __enter__(self):
+        self._previous = active()
+        _local.timer = self
+        self._start = timeit.default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.add('total', timeit.default_timer() - self._start)
+        _local.timer = self._previous
+        return False
+
+def active():
+    """ Returns the StageTimer active in this thread or None.
+    """
+    return getattr(_local, 'timer', None)
+
+@contextlib.contextmanager
+def _untimed():
+    yield
+
+def stage(name):
+    """ Context manager timing a block as stage name of the active
+    StageTimer, does nothing if no timer is active.
+    """
+    timer = active()
+    if timer is None:
+        return _untimed()
+    return timer.stage(name)
+
+def timed(name=None):
+    """ Decorator timing every call of a function as a stage (named
+    after the function unless name is given).
+    """
+    def decorator(function):
+        stageName = name or function.__name__
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            timer = active()
+            if timer is None:
+                return function(*args, **kwargs)
+            with timer.stage(stageName):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class Summary(object):
+    """ Totals of the stage timings of many pairs.
+    """
+    def __init__(self):
+        self.count = collections.OrderedDict()
+        self.total = collections.OrderedDict()
+        self.slowest = collections.OrderedDict()
+
+    def add(self, times):
+        """ Adds the times (a StageTimer.times dictionary) of one pair.
+        """
+        for name, seconds in times.items():
+            self.count[name] = self.count.get(name, 0) + 1
+            self.total[name] = self.total.get(name, 0.0) + seconds
+            self.slowest[name] = max(self.slowest.get(name, 0.0), seconds)
+
+    def table(self):
+        """ Returns the summary as a text table, slowest stage first.
+        """
+        runTotal = self.total.get('total', 0.0)
+        lines = ['%-20s %7s %10s %10s %10s %7s' % ('stage', 'pairs',
+                 'total (s)', 'mean (ms)', 'max (ms)', 'share')]
+        for name in sorted(self.total, key=self.total.get, reverse=True):
+            share = ''
+            if runTotal > 0:
+                share = '%.1f%%' % (100.0 * self.total[name] / runTotal)
+            lines.append('%-20s %7d %10.3f %10.2f %10.2f %7s' % (
+                name, self.count[name], self.total[name],
+                1000.0 * self.total[name] / self.count[name],
+                1000.0 * self.slowest[name], share))
+        return '\n'.join(lines)
+
+def peak_memory_mb():
+    """ Returns the peak resident memory of this process in MB (since
+    the last reset_peak_memory() on Linux), or None if it cannot be
+    measured.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0 # kilobytes
+    except (IOError, ValueError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / (1024.0 * 1024.0) # bytes
+    return peak / 1024.0 # kilobytes
+
+def reset_peak_memory():
+    """ Lowers the peak memory to what the process uses now, so
+    peak_memory_mb() gives the peak of the work done after the call.
+    Only possible on Linux, returns False elsewhere (the peak is then
+    the peak since the process started).
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clearRefs:
+            clearRefs.write('5')
+        return True
+    except (IOError, OSError):
+        return False
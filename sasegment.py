@@ -0,0 +1,163 @@
+""" sasegment.py - Pixel segmentation for the seed analyzer scripts.
+
+Replaces the external Plate and seed CART steps: a segmentation model
+labels every pixel of a B,G,R image with a class (e.g. 'plate', 'seed'
+or 'background') and mask(image, name) returns the binary image of one
+class, 255 where the pixel belongs to it and 0 elsewhere. Two models
+are available:
+
+    ChannelThresholds - a B,G,R range per class (cv2.inRange)
+    PixelClassifier - one Gaussian per class fitted to labeled sample
+        pixels, applied through a lookup table of the quantized colors
+
+Models are trained and saved with 'python sacli.py train' and used by
+the plate-crop and segment subcommands (see preproclib.plate_mask and
+preproclib.seed_mask). Developed and tested with Python 2.7.x and
+OpenCV 2.4.x as well as Python 3.x and OpenCV 4.x.
+"""
+
+import numpy as np
+import cv2
+
+class ChannelThresholds(object):
+    """ Segments by per-channel thresholds.
+
+    ranges - dictionary of class name to (lower, upper), each a B,G,R
+             triple, both bounds included
+    """
+    kind = 'thresholds'
+
+    def __init__(self, ranges):
+        self.names = sorted(ranges)
+        self.ranges = dict((name, (np.uint8(lower), np.uint8(upper)))
+                           for name, (lower, upper) in ranges.items())
+
+    def mask(self, image, name):
+        """ Returns the binary mask of class name (0 or 255).
+        """
+        lower, upper = self.ranges[name]
+        return cv2.inRange(image, lower, upper)
+
+    def save(self, path):
+        with open(path, 'wb') as modelFile:
+            np.savez(modelFile, kind=self.kind, names=np.array(self.names),
+                     lower=np.array([self.ranges[name][0]
+                                     for name in self.names]),
+                     upper=np.array([self.ranges[name][1]
+                                     for name in self.names]))
+
+class PixelClassifier(object):
+    """ Segments by the most likely of several Gaussian color classes.
+
+    The likelihoods are evaluated once for the center of every
+    quantized color (2**bits values per channel) and stored in a lookup
+    table, classifying an image is then one table lookup per pixel.
+
+    names - class names
+    means - (classes, 3) B,G,R means
+    covariances - (classes, 3, 3) B,G,R covariance matrices
+    bits - bits kept per channel for the lookup table (1 to 8)
+    """
+    kind = 'classifier'
+
+    def __init__(self, names, means, covariances, bits=5):
+        if not 1 <= bits <= 8:
+            raise ValueError('bits must be between 1 and 8')
+        self.names = list(names)
+        self.means = np.asarray(means, np.float64)
+        self.covariances = np.asarray(covariances, np.float64)
+        self.bits = bits
+        self.lut = self._build_lut()
+
+    @classmethod
+    def fit(cls, samples, bits=5):
+        """ Returns a classifier fitted to labeled sample pixels.
+
+        samples - dictionary of class name to a (pixels, 3) B,G,R array
+                  (see sample_pixels)
+        """
+        names = sorted(samples)
+        means = []
+        covariances = []
+        # Colors closer than a quantization step are not told apart,
+        #    so no class is narrower than the uniform variance of one.
+        minVariance = (256.0 / 2 ** bits) ** 2 / 12
+        for name in names:
+            pixels = np.asarray(samples[name], np.float64).reshape(-1, 3)
+            if len(pixels) < 2:
+                raise ValueError('Not enough sample pixels for ' + name)
+            means.append(pixels.mean(axis=0))
+            covariances.append(np.cov(pixels, rowvar=0) +
+                               minVariance * np.eye(3))
+        return cls(names, means, covariances, bits)
+
+    def _build_lut(self):
+        """ Returns the class index of every quantized color, indexed by
+        (b << 2 * bits) | (g << bits) | r of the quantized channels.
+        """
+        levels = 2 ** self.bits
+        step = 256.0 / levels
+        centers = (np.arange(levels) + 0.5) * step
+        b, g, r = np.meshgrid(centers, centers, centers, indexing='ij')
+        colors = np.column_stack((b.ravel(), g.ravel(), r.ravel()))
+        scores = np.empty((len(self.names), len(colors)))
+        for i in range(len(self.names)):
+            difference = colors - self.means[i]
+            inverse = np.linalg.inv(self.covariances[i])
+            # Log likelihood up to a constant, equal priors.
+            scores[i] = -0.5 * (np.einsum('ij,jk,ik->i', difference,
+                                          inverse, difference) +
+                                np.log(np.linalg.det(self.covariances[i])))
+        return np.uint8(np.argmax(scores, axis=0))
+
+    def classify(self, image):
+        """ Returns the class index of every pixel of a B,G,R image.
+        """
+        quantized = image >> (8 - self.bits)
+        index = quantized[..., 0].astype(np.int32)
+        index <<= self.bits
+        index |= quantized[..., 1]
+        index <<= self.bits
+        index |= quantized[..., 2]
+        return self.lut.take(index)
+
+    def mask(self, image, name):
+        """ Returns the binary mask of class name (0 or 255).
+        """
+        return cv2.compare(self.classify(image), self.names.index(name),
+                           cv2.CMP_EQ)
+
+    def save(self, path):
+        with open(path, 'wb') as modelFile:
+            np.savez(modelFile, kind=self.kind, names=np.array(self.names),
+                     means=self.means, covariances=self.covariances,
+                     bits=self.bits)
+
+def sample_pixels(image, mask=None):
+    """ Returns the B,G,R pixels of an image as a (pixels, 3) array,
+    only those where mask is not 0 if a mask is given.
+    """
+    if mask is None:
+        return image.reshape(-1, 3)
+    return image[mask != 0]
+
+def load_model(path):
+    """ Returns the ChannelThresholds or PixelClassifier saved in path.
+    Raises ValueError if the file holds no segmentation model.
+    """
+    data = np.load(path)
+    try:
+        kind = str(data['kind'])
+        names = [str(name) for name in data['names']]
+        if kind == ChannelThresholds.kind:
+            return ChannelThresholds(dict(
+                (name, (lower, upper)) for name, lower, upper
+                in zip(names, data['lower'], data['upper'])))
+        if kind == PixelClassifier.kind:
+            return PixelClassifier(names, data['means'], data['covariances'],
+                                   int(data['bits']))
+    except KeyError:
+        pass
+    finally:
+        data.close()
+    raise ValueError('Not a segmentation model: ' + path)
@@ -0,0 +1,191 @@
+""" sasink.py - Result output of the seed analyzer scripts.
+
+samain.py hands every result row (a dictionary of typed values, e.g.
+floats for the measurements) to one or more sinks:
+
+    CsvSink - the <directory>_processed.csv file. Values are written
+        with str() as they always were, and the file is flushed to disk
+        every resultFlushRows rows, so a crashed run keeps the rows it
+        had finished.
+    NpzSink - numpy .npz file with one typed array per column, for
+        analyses that should not parse the CSV.
+    ParquetSink - Parquet file written in row groups, needs pyarrow.
+
+columnar_sink() picks NpzSink or ParquetSink from the file extension.
+Developed and tested with Python 2.7.x and 3.x.
+"""
+
+import os
+import csv
+import numpy as np
+import saconfig as sacfg
+import sacompat
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None # Parquet output is not available.
+
+class CsvSink(object):
+    """ Writes rows to a CSV file and flushes them to disk regularly.
+
+    path - CSV file, replaced if it exists (unless append is set)
+    fieldnames - columns in order, missing values are left empty
+    flushRows - rows between flushes, 0 only flushes when closing
+    append - add the rows to the end of an existing file, the header
+             is only written if the file is new or empty
+    """
+    def __init__(self, path, fieldnames, flushRows=None, append=False):
+        if flushRows is None:
+            flushRows = sacfg.resultFlushRows
+        self.flushRows = flushRows
+        hasHeader = (append and os.path.isfile(path) and
+                     os.path.getsize(path) > 0)
+        self._file = sacompat.open_csv(path, 'a' if append else 'w')
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames)
+        if not hasHeader:
+            self._writer.writeheader()
+        self._pending = 0
+
+    def write(self, row):
+        # str() keeps the output of the earlier versions, the csv module
+        #    would write floats with repr() on Python 2 (on Python 3 both
+        #    give all digits).
+        self._writer.writerow(dict((name, str(value))
+                                   for name, value in row.items()
+                                   if value is not None))
+        self._pending += 1
+        if self.flushRows and self._pending >= self.flushRows:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+class NpzSink(object):
+    """ Collects rows and saves one array per column to a .npz file.
+
+    Columns of type float are float64 with NaN for missing values,
+    columns of type int are int64 with -1 for missing values and str
+    columns are string arrays. The file is written when the sink is
+    closed.
+
+    path - .npz file
+    fieldnames - columns in order
+    types - dictionary of column name to float, int or str
+    """
+    def __init__(self, path, fieldnames, types):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.types = types
+        self._columns = dict((name, []) for name in fieldnames)
+
+    def write(self, row):
+        for name in self.fieldnames:
+            self._columns[name].append(typed_value(row.get(name),
+                                                   self.types[name]))
+
+    def close(self):
+        if self._columns is None:
+            return
+        arrays = {}
+        for name in self.fieldnames:
+            values = self._columns[name]
+            if self.types[name] is float:
+                arrays[name] = np.array([np.nan if value is None else value
+                                         for value in values], np.float64)
+            elif self.types[name] is int:
+                arrays[name] = np.array([-1 if value is None else value
+                                         for value in values], np.int64)
+            else:
+                arrays[name] = np.array(['' if value is None else value
+                                         for value in values])
+        # np.savez adds .npz to other names, write to the name given.
+        with open(self.path + '.tmp', 'wb') as npzFile:
+            np.savez(npzFile, **arrays)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(self.path + '.tmp', self.path)
+        self._columns = None
+
+class ParquetSink(object):
+    """ Writes rows to a Parquet file in row groups of resultFlushRows
+    rows. Missing values are stored as nulls.
+
+    path - .parquet file
+    fieldnames - columns in order
+    types - dictionary of column name to float, int or str
+    """
+    def __init__(self, path, fieldnames, types, flushRows=None):
+        if pyarrow is None:
+            raise ImportError('Parquet output needs pyarrow')
+        if flushRows is None:
+            flushRows = sacfg.resultFlushRows
+        arrowTypes = {float:pyarrow.float64(), int:pyarrow.int64(),
+                      str:pyarrow.string()}
+        self.fieldnames = fieldnames
+        self.types = types
+        self.flushRows = max(flushRows, 1)
+        self._schema = pyarrow.schema([(name, arrowTypes[types[name]])
+                                       for name in fieldnames])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+        self._rows = []
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.flushRows:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        columns = [pyarrow.array([typed_value(row.get(name), self.types[name])
+                                  for row in self._rows],
+                                 self._schema.field(name).type)
+                   for name in self.fieldnames]
+        self._writer.write_table(pyarrow.Table.from_arrays(
+            columns, schema=self._schema))
+        self._rows = []
+
+    def close(self):
+        if self._writer is not None:
+            self.flush()
+            self._writer.close()
+            self._writer = None
+
+def typed_value(value, columnType):
+    """ Returns a row value converted to a column type, None if the
+    value is missing. Rows read back from a result cache of an older
+    version hold strings.
+    """
+    if value is None or value == '':
+        return None if columnType is not str else ''
+    return columnType(value)
+
+def columnar_format(path):
+    """ Returns 'npz' or 'parquet' for a columnar output file, by its
+    extension. Raises ValueError for other files and ImportError for
+    Parquet without pyarrow.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npz':
+        return 'npz'
+    if extension in ('.parquet', '.pq'):
+        if pyarrow is None:
+            raise ImportError('Parquet output needs pyarrow')
+        return 'parquet'
+    raise ValueError('Unknown columnar output (use .npz or .parquet): ' +
+                     path)
+
+def columnar_sink(path, fieldnames, types):
+    """ Returns the columnar sink for a file (see columnar_format).
+    """
+    if columnar_format(path) == 'npz':
+        return NpzSink(path, fieldnames, types)
+    return ParquetSink(path, fieldnames, types)
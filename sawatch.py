@@ -0,0 +1,215 @@
+""" sawatch.py - Analyzes seed images while the SSA captures them.
+
+Watches a capture directory for new TopImage/SideImage pairs (paired
+the way samain.py pairs them) and as soon as both images of a pair are
+completely written, pre-processes them in memory (color correction,
+crops and with a segmentation model the plate crop and seed
+segmentation, see preproclib.py) and measures the seed with
+samain.analyzeSeedImages(). Every result is appended to
+<directory>_processed.csv right away. Pairs that are already in that
+file are skipped, so the watcher can be stopped and started again.
+
+    python sacli.py watch DIR [--red R --green G --blue B] [--model MODEL]
+
+An image counts as completely written when its size and modification
+time did not change for one polling interval and it can be decoded.
+The directory is polled, if the watchdog package is installed its file
+system events (inotify on Linux) start the next poll early. Developed
+and tested with Python 2.7.x and OpenCV 2.4.x as well as Python 3.x
+and OpenCV 4.x.
+"""
+
+import os
+import csv
+import glob
+import time
+import threading
+import cv2
+import saimage
+import samain
+import sasink
+import preproclib
+import saconfig as sacfg
+import sacompat
+try:
+    import watchdog.events
+    import watchdog.observers
+except ImportError:
+    watchdog = None # Polling only.
+
+class FileTracker(object):
+    """ Tells whether files have stopped changing.
+
+    settle - seconds a file must be unchanged
+    """
+    def __init__(self, settle):
+        self.settle = settle
+        self._states = {}
+
+    def stable(self, path):
+        """ Returns True if path is not empty, has the same size and
+        modification time as when last asked and was last modified at
+        least settle seconds ago.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._states.pop(path, None)
+            return False
+        state = (stat.st_size, stat.st_mtime)
+        previous = self._states.get(path)
+        self._states[path] = state
+        return (state == previous and stat.st_size > 0 and
+                time.time() - stat.st_mtime >= self.settle)
+
+    def forget(self, path):
+        self._states.pop(path, None)
+
+def processed_files(csvPath):
+    """ Returns the set of top images already in a results CSV file.
+    """
+    if not os.path.isfile(csvPath):
+        return set()
+    with sacompat.open_csv(csvPath) as csvFile:
+        return set(row['file path'] for row in csv.DictReader(csvFile))
+
+class PairWatcher(object):
+    """ Finds completely written pairs in a directory and analyzes them.
+
+    directory - capture directory with the TopImage/SideImage files
+    topStages - pre-processing stages of the top images (see
+                preproclib.run_pipeline), empty for none
+    sideStages - pre-processing stages of the side images
+    interval - seconds between polls, also the time an image must be
+               unchanged before it is used
+    maxDecodeFailures - times a stable pair may fail to decode before
+                        it is recorded with an error
+    """
+    def __init__(self, directory, topStages, sideStages, interval=1.0,
+                 maxDecodeFailures=10):
+        self.directory = directory
+        self.topStages = topStages
+        self.sideStages = sideStages
+        self.interval = interval
+        self.maxDecodeFailures = maxDecodeFailures
+        self.csvPath = directory + '_processed.csv'
+        self._tracker = FileTracker(interval)
+        self._done = processed_files(self.csvPath)
+        self._number = len(self._done)
+        self._decodeFailures = {}
+        self._wake = threading.Event()
+        self._observer = None
+        fieldnames = samain.fieldnames
+        if sacfg.multiSeed:
+            fieldnames = fieldnames + ['seed index']
+        self._sink = sasink.CsvSink(self.csvPath, fieldnames, flushRows=1,
+                                    append=True)
+
+    def ready_pairs(self):
+        """ Returns the (top, side) pairs whose images are both
+        completely written and that were not analyzed yet.
+        """
+        pairs = []
+        for top_fileName in sorted(glob.glob(self.directory + '/TopImage*')):
+            if top_fileName in self._done:
+                continue
+            side_fileName = samain.findSideFileName(top_fileName)
+            # Both are asked every poll, so both keep their state.
+            topStable = self._tracker.stable(top_fileName)
+            sideStable = self._tracker.stable(side_fileName)
+            if topStable and sideStable:
+                pairs.append((top_fileName, side_fileName))
+        return pairs
+
+    def load(self, fileName, stages):
+        """ Returns (color, gray) of an image after the pre-processing
+        stages.
+        """
+        color, gray = saimage.load_image(fileName)
+        if stages:
+            color = preproclib.run_pipeline(color, stages)
+            gray = cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+        return color, gray
+
+    def analyze(self, top_fileName, side_fileName):
+        """ Analyzes one pair and appends its row to the CSV file.
+
+        Returns False if an image could not be decoded yet, the pair is
+        then tried again at the next poll.
+        """
+        try:
+            top_imageColor, top_imageBW = self.load(top_fileName,
+                                                    self.topStages)
+            side_imageColor, side_imageBW = self.load(side_fileName,
+                                                      self.sideStages)
+        except IOError:
+            failures = self._decodeFailures.get(top_fileName, 0) + 1
+            self._decodeFailures[top_fileName] = failures
+            if failures < self.maxDecodeFailures:
+                # A writer that paused, both must be stable again.
+                self._tracker.forget(top_fileName)
+                self._tracker.forget(side_fileName)
+                return False
+            rows = [{'file path':top_fileName, 'error':'unreadable_image-'}]
+        else:
+            # One row per seed with multiSeed (see samain.analyzeSeeds).
+            analyze = samain.analyzeSeedsImages
+            if not sacfg.multiSeed:
+                analyze = lambda *images: [samain.analyzeSeedImages(*images)]
+            try:
+                rows = analyze(top_fileName, top_imageColor, top_imageBW,
+                               side_imageColor, side_imageBW)
+            except Exception as e:
+                rows = [{'file path':top_fileName,
+                         'error':'exception_' + type(e).__name__ + '-'}]
+        for row in rows:
+            row['number'] = self._number
+            self._sink.write(row)
+        print('processed: ' + top_fileName + '  [' + str(self._number) + ']')
+        self._number += 1
+        self._done.add(top_fileName)
+        self._decodeFailures.pop(top_fileName, None)
+        self._tracker.forget(top_fileName)
+        self._tracker.forget(side_fileName)
+        return True
+
+    def poll(self):
+        """ Analyzes every pair that is ready, returns how many.
+        """
+        analyzed = 0
+        for top_fileName, side_fileName in self.ready_pairs():
+            if self.analyze(top_fileName, side_fileName):
+                analyzed += 1
+        return analyzed
+
+    def run(self, timeout=0):
+        """ Polls the directory until stopped (Ctrl-C), or until no pair
+        was analyzed for timeout seconds if timeout is not 0.
+        """
+        self._start_events()
+        lastAnalyzed = time.time()
+        while True:
+            if self.poll():
+                lastAnalyzed = time.time()
+            elif timeout and time.time() - lastAnalyzed >= timeout:
+                return
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def close(self):
+        """ Stops watching and closes the CSV file.
+        """
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        self._sink.close()
+
+    def _start_events(self):
+        if watchdog is None or self._observer is not None:
+            return
+        handler = watchdog.events.FileSystemEventHandler()
+        handler.on_any_event = lambda event: self._wake.set()
+        self._observer = watchdog.observers.Observer()
+        self._observer.schedule(handler, self.directory)
+        self._observer.start()
@@ -0,0 +1,129 @@
+""" Tests of salib.py.
+
+Run with python -m unittest discover tests (or pytest) from the
+repository directory.
+"""
+
+import math
+import os
+import sys
+import unittest
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+import sacompat
+import salib
+
+def per_rect_geometry(bounds):
+    """ Length, width, angle and center of one cv2.minAreaRect() result as
+    findLengthWidth() computed them before boxGeometry() (one seed at a
+    time, in Python).
+    """
+    box = sacompat.box_points(bounds) # Create a rotated rectangle
+    box = box.astype(np.intp) # np.int0(), the box has four corners
+    A = ((box[0][0]+box[1][0])//2 , (box[0][1]+box[1][1])//2)
+    B = ((box[1][0]+box[2][0])//2 , (box[1][1]+box[2][1])//2)
+    C = ((box[2][0]+box[3][0])//2 , (box[2][1]+box[3][1])//2)
+    D = ((box[3][0]+box[0][0])//2 , (box[3][1]+box[0][1])//2)
+    centerPoint = ((B[0]+D[0])//2 , (A[1]+C[1])//2)
+    distance1 = math.sqrt(math.pow(B[0]-D[0],2)+math.pow(B[1]-D[1],2))
+    distance2 = math.sqrt(math.pow(A[0]-C[0],2)+math.pow(A[1]-C[1],2))
+    if distance1 > distance2:
+        return distance1, distance2, 90+bounds[2], centerPoint
+    return distance2, distance1, bounds[2], centerPoint
+
+def random_seed_images(count, seed=0):
+    """ Yields B/W images with one filled, rotated ellipse each, the
+    sizes, angles and sub-pixel centers chosen at random.
+    """
+    random = np.random.RandomState(seed)
+    for unused in range(count):
+        image = np.zeros((240,320), np.uint8)
+        center = (random.uniform(100,220), random.uniform(80,160))
+        axes = (random.uniform(5,70), random.uniform(3,40))
+        angle = random.uniform(0,180)
+        cv2.ellipse(image, (center,axes,angle), 255, -1)
+        yield image
+
+class BoxGeometryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.contours = []
+        for image in random_seed_images(400):
+            contours, unused = sacompat.find_contours(
+                image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            self.contours.extend(contours)
+
+    def test_random_ellipses(self):
+        geometry = salib.boxGeometry(salib.contourRects(self.contours))
+        for i, contour in enumerate(self.contours):
+            length, width, angle, center = per_rect_geometry(
+                cv2.minAreaRect(contour))
+            self.assertEqual(geometry['length'][i], length)
+            self.assertEqual(geometry['width'][i], width)
+            self.assertEqual(geometry['angle'][i], angle)
+            self.assertEqual(tuple(geometry['center'][i]), center)
+
+    def test_random_point_sets(self):
+        # minAreaRect() of a few scattered points often has corners on
+        #    pixel borders, where the float rounding of the corners
+        #    decides the pixel they are cut to.
+        random = np.random.RandomState(5)
+        contours = [(random.randint(0,2000,2)+
+                     random.randint(-150,150,(random.randint(3,12),2)))
+                    .astype(np.int32).reshape(-1,1,2) for unused in range(5000)]
+        geometry = salib.boxGeometry(salib.contourRects(contours))
+        for i, contour in enumerate(contours):
+            length, width, angle, center = per_rect_geometry(
+                cv2.minAreaRect(contour))
+            self.assertEqual(geometry['length'][i], length)
+            self.assertEqual(geometry['width'][i], width)
+            self.assertEqual(geometry['angle'][i], angle)
+            self.assertEqual(tuple(geometry['center'][i]), center)
+
+    def test_empty(self):
+        geometry = salib.boxGeometry(salib.contourRects([]))
+        self.assertEqual(len(geometry['length']), 0)
+        self.assertEqual(geometry['center'].shape, (0,2))
+
+    def test_find_length_width(self):
+        for image in random_seed_images(50, seed=1):
+            result = salib.findLengthWidth(image, 127)
+            contour = result['contours'][result['largestIndex']]
+            length, width, angle, center = per_rect_geometry(
+                cv2.minAreaRect(contour))
+            self.assertEqual(result['length'], length)
+            self.assertEqual(result['width'], width)
+            self.assertEqual(result['angle'], angle)
+            self.assertEqual(result['center'], center)
+
+class RotateImageTest(unittest.TestCase):
+
+    def test_roi_matches_full_frame(self):
+        # Rotating only a roi gives the pixels of the full rotated image.
+        #    Newer OpenCV builds round some pixels by the output size, so
+        #    they may differ by one.
+        random = np.random.RandomState(2)
+        for image in random_seed_images(100, seed=2):
+            # Background texture, pixels from outside the roi rotate
+            #    into it.
+            image = np.maximum(image, random.randint(0,100,image.shape)
+                               .astype(np.uint8))
+            image = cv2.GaussianBlur(image, (5,5), 0)
+            geometry = salib.findLengthWidth(image, 127)
+            seed = geometry['contours'][geometry['largestIndex']]
+            roi = salib.seedRoi(seed, geometry['center'], image.shape, 20)
+            angle = random.uniform(-90, 90)
+            x, y, w, h = roi
+            full = salib.rotateImage(image, angle, geometry['center'])
+            rotated = salib.rotateImage(image, angle, geometry['center'],
+                                        roi)
+            self.assertEqual(rotated.shape, (h, w))
+            difference = np.abs(rotated.astype(int)-full[y:y+h,x:x+w])
+            self.assertTrue(difference.max() <= 1)
+
+if __name__ == '__main__':
+    unittest.main()
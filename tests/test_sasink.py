@@ -0,0 +1,86 @@
+""" Tests of sasink.py.
+
+Run with python -m unittest discover tests (or pytest) from the
+repository directory. The Parquet tests are skipped without pyarrow.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+import sasink
+
+FIELDNAMES = ['number', 'file path', 'length (cm)', 'error']
+TYPES = {'number':int, 'file path':str, 'length (cm)':float, 'error':str}
+ROWS = [{'number':0, 'file path':'TopImage000.png', 'length (cm)':0.5,
+         'error':''},
+        {'number':1, 'file path':'TopImage001.png',
+         'error':'exception_IOError-'},
+        {'number':2, 'file path':'TopImage002.png', 'length (cm)':'0.75',
+         'error':''}] # A string as read back from an older result cache.
+
+class SinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='sasink')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, sink):
+        for row in ROWS:
+            sink.write(row)
+        sink.close()
+
+    def test_npz(self):
+        path = os.path.join(self.directory, 'results.npz')
+        self.write(sasink.columnar_sink(path, FIELDNAMES, TYPES))
+        arrays = np.load(path)
+        self.assertEqual(list(arrays['number']), [0, 1, 2])
+        self.assertEqual(arrays['length (cm)'][0], 0.5)
+        self.assertTrue(np.isnan(arrays['length (cm)'][1]))
+        self.assertEqual(arrays['length (cm)'][2], 0.75)
+        self.assertEqual(list(arrays['error']),
+                         ['', 'exception_IOError-', ''])
+
+    @unittest.skipIf(sasink.pyarrow is None, 'needs pyarrow')
+    def test_parquet(self):
+        path = os.path.join(self.directory, 'results.parquet')
+        sink = sasink.columnar_sink(path, FIELDNAMES, TYPES)
+        self.assertTrue(isinstance(sink, sasink.ParquetSink))
+        sink.flushRows = 2 # Two row groups.
+        self.write(sink)
+        parquetFile = sasink.pyarrow.parquet.ParquetFile(path)
+        self.assertEqual(parquetFile.metadata.num_row_groups, 2)
+        table = parquetFile.read()
+        self.assertEqual(table.column_names, FIELDNAMES)
+        self.assertEqual(str(table.schema.field('number').type), 'int64')
+        self.assertEqual(str(table.schema.field('length (cm)').type),
+                         'double')
+        columns = table.to_pydict()
+        self.assertEqual(columns['number'], [0, 1, 2])
+        self.assertEqual(columns['file path'],
+                         [row['file path'] for row in ROWS])
+        self.assertEqual(columns['length (cm)'], [0.5, None, 0.75])
+        self.assertEqual(columns['error'], ['', 'exception_IOError-', ''])
+
+    @unittest.skipIf(sasink.pyarrow is None, 'needs pyarrow')
+    def test_parquet_empty(self):
+        path = os.path.join(self.directory, 'results.parquet')
+        sasink.columnar_sink(path, FIELDNAMES, TYPES).close()
+        table = sasink.pyarrow.parquet.read_table(path)
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.column_names, FIELDNAMES)
+
+    def test_unknown_extension(self):
+        self.assertRaises(ValueError, sasink.columnar_format,
+                          os.path.join(self.directory, 'results.txt'))
+
+if __name__ == '__main__':
+    unittest.main()